@@ -11,7 +11,7 @@ from typing import Optional, Dict, Any
 import uuid
 
 from ..models import ChatRequest, ChatResponse, StreamChatResponse, MessageRole, MessageStatus
-from ..services import CharacterLoader, SessionManager, LLMConnector, PromptBuilder
+from ..services import CharacterLoader, SessionManager, LLMConnector, PromptBuilder, get_llm_connector
 from ..core.exceptions import CharacterNotFoundError, SessionNotFoundError, LLMError, ValidationError
 from ..core.security import ContentFilter, RateLimiter
 from ..core.config import get_settings
@@ -25,9 +25,6 @@ def get_character_loader():
 def get_session_manager():
     return SessionManager()
 
-def get_llm_connector():
-    return LLMConnector()
-
 def get_prompt_builder():
     return PromptBuilder()
 
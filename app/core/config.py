@@ -75,6 +75,16 @@ class Settings(BaseSettings):
         ge=0,
         le=10
     )
+    enable_hedged_requests: bool = Field(
+        default=False,
+        description="启用对冲请求（主提供商响应慢时并行请求备用提供商）"
+    )
+    hedge_delay_seconds: float = Field(
+        default=0.5,
+        description="发起备用请求前等待主提供商的时间（秒）",
+        ge=0.0,
+        le=30.0
+    )
     
     # ============================================================================
     # 聊天机器人配置
@@ -105,7 +115,7 @@ class Settings(BaseSettings):
     enable_character_cache: bool = Field(default=True, description="启用角色缓存")
     character_cache_ttl: int = Field(
         default=3600,
-        description="角色缓存TTL（秒）",
+        description="角色缓存TTL（秒）。已弃用：角色缓存按文件修改时间和大小校验，不再按时间过期",
         ge=60,
         le=86400
     )
@@ -130,6 +130,8 @@ async def shutdown_event():
     try:
         # 这里可以添加清理逻辑
         # 例如：关闭数据库连接、保存状态等
+        from app.services.llm_connector import close_llm_connector
+        await close_llm_connector()
         logger.info("资源清理完成")
     except Exception as e:
         logger.error(f"资源清理失败: {e}")
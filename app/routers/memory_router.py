@@ -3,12 +3,19 @@
 """
 
 from fastapi import APIRouter, HTTPException, Depends, Query
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Tuple, AsyncGenerator
 from datetime import datetime, timedelta
 from enum import Enum
+from dataclasses import dataclass, asdict
+from collections import OrderedDict
 import json
 import logging
+import re
+import time
+
+import jieba
 
 logger = logging.getLogger(__name__)
 
@@ -27,6 +34,10 @@ class MemoryImportance(str, Enum):
     MEDIUM = "medium"     # 一般
     LOW = "low"           # 不重要
 
+# 枚举派生常量，避免每次请求重新遍历枚举
+MEMORY_TYPE_COUNT = len(MemoryType)
+HIGH_IMPORTANCE_LEVELS = frozenset({MemoryImportance.HIGH, MemoryImportance.CRITICAL})
+
 class Memory(BaseModel):
     id: str
     type: MemoryType
@@ -40,6 +51,21 @@ class Memory(BaseModel):
     access_count: int
     related_memories: List[str]
 
+@dataclass(slots=True)
+class MemoryRecord:
+    """进程内记忆存储结构（字段与Memory一致，跳过Pydantic校验）"""
+    id: str
+    type: MemoryType
+    importance: MemoryImportance
+    content: str
+    keywords: List[str]
+    emotions: List[str]
+    context: Dict[str, Any]
+    created_at: str
+    last_accessed: str
+    access_count: int
+    related_memories: List[str]
+
 class MemoryCreate(BaseModel):
     type: MemoryType
     content: str
@@ -60,22 +86,125 @@ class MemorySearch(BaseModel):
     importance_levels: Optional[List[MemoryImportance]] = None
     date_range: Optional[Dict[str, str]] = None
 
-# 模拟记忆数据库
-memories_db: Dict[str, Dict[str, Memory]] = {}  # character_id -> session_id -> memories
+class SessionMemoryStore:
+    """
+    会话记忆存储
+
+    以 (character_id, session_id) 为键保存每个会话的记忆字典，
+    超过容量时淘汰最久未访问的会话，超过TTL未访问的会话视为过期。
+    """
+
+    def __init__(self, maxsize: int = 10000, ttl: float = 3600):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Tuple[str, str], Tuple[float, Dict[str, MemoryRecord]]]" = OrderedDict()
+
+    def get(self, key: Tuple[str, str]) -> Optional[Dict[str, MemoryRecord]]:
+        """获取会话记忆，过期或不存在时返回None"""
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        now = time.monotonic()
+        if entry[0] <= now:
+            del self._data[key]
+            return None
+        self._data[key] = (now + self.ttl, entry[1])
+        self._data.move_to_end(key)
+        return entry[1]
+
+    def setdefault(self, key: Tuple[str, str]) -> Dict[str, MemoryRecord]:
+        """获取会话记忆，不存在时创建空记忆字典"""
+        memories = self.get(key)
+        if memories is None:
+            memories = {}
+            self._data[key] = (time.monotonic() + self.ttl, memories)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+        return memories
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+# 模拟记忆数据库：(character_id, session_id) -> memories
+memories_db = SessionMemoryStore(maxsize=10000, ttl=3600)
 
 def generate_memory_id() -> str:
     """生成记忆ID"""
     import secrets
     return f"mem_{secrets.token_hex(8)}"
 
+# 关键词停用词
+STOPWORDS = frozenset({"的", "了", "在", "是", "我", "你", "他", "她", "它", "们", "和", "与"})
+
+# 导入时加载分词词典，避免首次提取记忆时承担词典初始化开销
+jieba.initialize()
+
 def extract_keywords(text: str) -> List[str]:
-    """从文本中提取关键词"""
-    # 简单的关键词提取（实际应用中可使用NLP技术）
-    common_words = {"的", "了", "在", "是", "我", "你", "他", "她", "它", "们", "和", "与"}
-    words = text.split()
-    keywords = [word for word in words if len(word) > 1 and word not in common_words]
+    """从文本中提取关键词（中文使用jieba分词）"""
+    words = jieba.lcut_for_search(text)
+    keywords = [
+        word for word in words
+        if len(word) > 1 and not word.isspace() and word not in STOPWORDS
+    ]
     return keywords[:5]  # 返回前5个关键词
 
+# 情感指示词：情感名 -> 指示词
+EMOTION_INDICATORS = {
+    "开心": ["高兴", "开心", "快乐", "兴奋"],
+    "难过": ["难过", "伤心", "沮丧", "失望"],
+    "愤怒": ["生气", "愤怒", "烦躁", "讨厌"],
+    "紧张": ["紧张", "焦虑", "担心", "害怕"]
+}
+
+# 所有指示词合并为一个命名分组正则，组名即情感名
+EMOTION_PATTERN = re.compile("|".join(
+    f"(?P<{emotion}>{'|'.join(map(re.escape, indicators))})"
+    for emotion, indicators in EMOTION_INDICATORS.items()
+))
+
+@dataclass(frozen=True)
+class ExtractionRule:
+    """记忆提取规则，pattern为None时由情感预扫描结果触发"""
+    type: MemoryType
+    importance: MemoryImportance
+    pattern: Optional["re.Pattern[str]"]
+    content_template: str
+    context_key: str
+    extra_context: Dict[str, Any]
+
+# 按顺序执行的提取规则表
+EXTRACTION_RULES = (
+    ExtractionRule(
+        type=MemoryType.FACTUAL,
+        importance=MemoryImportance.HIGH,
+        pattern=re.compile("我是|我叫|我的|我在|我喜欢"),
+        content_template="用户说: {message}",
+        context_key="conversation_context",
+        extra_context={"extraction_method": "keyword_matching"}
+    ),
+    ExtractionRule(
+        type=MemoryType.EMOTIONAL,
+        importance=MemoryImportance.MEDIUM,
+        pattern=None,
+        content_template="用户表现出{emotions}的情绪: {message}",
+        context_key="emotional_context",
+        extra_context={}
+    ),
+    ExtractionRule(
+        type=MemoryType.PREFERENCE,
+        importance=MemoryImportance.HIGH,
+        pattern=re.compile("喜欢|讨厌|最爱|最恨|偏爱"),
+        content_template="用户偏好: {message}",
+        context_key="preference_context",
+        extra_context={"extraction_confidence": 0.8}
+    ),
+)
+
+def detect_emotions(text: str) -> List[str]:
+    """检测文本中出现的情感，按EMOTION_INDICATORS顺序返回"""
+    found = {match.lastgroup for match in EMOTION_PATTERN.finditer(text)}
+    return [emotion for emotion in EMOTION_INDICATORS if emotion in found]
+
 @router.post("/extract/{character_id}/{session_id}")
 async def extract_memories_from_conversation(
     character_id: str,
@@ -89,95 +218,49 @@ async def extract_memories_from_conversation(
     extracted_memories = []
     
     # 初始化角色记忆存储
-    if character_id not in memories_db:
-        memories_db[character_id] = {}
-    if session_id not in memories_db[character_id]:
-        memories_db[character_id][session_id] = {}
+    session_memories = memories_db.setdefault((character_id, session_id))
     
     # 分析用户消息中的信息
     user_keywords = extract_keywords(user_message)
-    
-    # 提取事实信息
-    if any(keyword in user_message for keyword in ["我是", "我叫", "我的", "我在", "我喜欢"]):
-        memory_id = generate_memory_id()
-        factual_memory = Memory(
-            id=memory_id,
-            type=MemoryType.FACTUAL,
-            importance=MemoryImportance.HIGH,
-            content=f"用户说: {user_message}",
-            keywords=user_keywords,
-            emotions=["neutral"],
-            context={
-                "conversation_context": character_response,
-                "extraction_method": "keyword_matching"
-            },
-            created_at=datetime.now().isoformat(),
-            last_accessed=datetime.now().isoformat(),
-            access_count=1,
-            related_memories=[]
-        )
-        memories_db[character_id][session_id][memory_id] = factual_memory
-        extracted_memories.append(factual_memory)
-    
-    # 提取情感信息
-    emotion_indicators = {
-        "开心": ["高兴", "开心", "快乐", "兴奋"],
-        "难过": ["难过", "伤心", "沮丧", "失望"],
-        "愤怒": ["生气", "愤怒", "烦躁", "讨厌"],
-        "紧张": ["紧张", "焦虑", "担心", "害怕"]
-    }
-    
-    detected_emotions = []
-    for emotion, indicators in emotion_indicators.items():
-        if any(indicator in user_message for indicator in indicators):
-            detected_emotions.append(emotion)
-    
-    if detected_emotions:
-        memory_id = generate_memory_id()
-        emotional_memory = Memory(
-            id=memory_id,
-            type=MemoryType.EMOTIONAL,
-            importance=MemoryImportance.MEDIUM,
-            content=f"用户表现出{'/'.join(detected_emotions)}的情绪: {user_message}",
-            keywords=user_keywords,
-            emotions=detected_emotions,
-            context={
-                "emotional_context": character_response,
-                "detected_emotions": detected_emotions
-            },
-            created_at=datetime.now().isoformat(),
-            last_accessed=datetime.now().isoformat(),
-            access_count=1,
-            related_memories=[]
-        )
-        memories_db[character_id][session_id][memory_id] = emotional_memory
-        extracted_memories.append(emotional_memory)
-    
-    # 提取偏好信息
-    if any(keyword in user_message for keyword in ["喜欢", "讨厌", "最爱", "最恨", "偏爱"]):
+    detected_emotions = detect_emotions(user_message)
+    now = datetime.now().isoformat()
+    
+    for rule in EXTRACTION_RULES:
+        if rule.pattern is None:
+            if not detected_emotions:
+                continue
+        elif not rule.pattern.search(user_message):
+            continue
+        
+        context = {rule.context_key: character_response, **rule.extra_context}
+        if rule.pattern is None:
+            emotions = detected_emotions
+            context["detected_emotions"] = detected_emotions
+        else:
+            emotions = ["neutral"]
+        
         memory_id = generate_memory_id()
-        preference_memory = Memory(
+        memory = MemoryRecord(
             id=memory_id,
-            type=MemoryType.PREFERENCE,
-            importance=MemoryImportance.HIGH,
-            content=f"用户偏好: {user_message}",
+            type=rule.type,
+            importance=rule.importance,
+            content=rule.content_template.format(
+                message=user_message, emotions="/".join(emotions)
+            ),
             keywords=user_keywords,
-            emotions=["neutral"],
-            context={
-                "preference_context": character_response,
-                "extraction_confidence": 0.8
-            },
-            created_at=datetime.now().isoformat(),
-            last_accessed=datetime.now().isoformat(),
+            emotions=emotions,
+            context=context,
+            created_at=now,
+            last_accessed=now,
             access_count=1,
             related_memories=[]
         )
-        memories_db[character_id][session_id][memory_id] = preference_memory
-        extracted_memories.append(preference_memory)
+        session_memories[memory_id] = memory
+        extracted_memories.append(memory)
     
     return {
         "success": True,
-        "extracted_memories": [mem.dict() for mem in extracted_memories],
+        "extracted_memories": [asdict(mem) for mem in extracted_memories],
         "total_extracted": len(extracted_memories)
     }
 
@@ -191,10 +274,11 @@ async def get_character_memories(
     offset: int = Query(0, ge=0)
 ):
     """获取角色记忆列表"""
-    if character_id not in memories_db or session_id not in memories_db[character_id]:
+    session_memories = memories_db.get((character_id, session_id))
+    if session_memories is None:
         return {"success": True, "memories": [], "total": 0}
     
-    memories = list(memories_db[character_id][session_id].values())
+    memories = list(session_memories.values())
     
     # 应用筛选条件
     if memory_type:
@@ -211,7 +295,7 @@ async def get_character_memories(
     
     return {
         "success": True,
-        "memories": [mem.dict() for mem in memories],
+        "memories": [asdict(mem) for mem in memories],
         "total": total,
         "pagination": {
             "limit": limit,
@@ -227,10 +311,11 @@ async def search_memories(
     search_data: MemorySearch
 ):
     """搜索记忆"""
-    if character_id not in memories_db or session_id not in memories_db[character_id]:
+    session_memories = memories_db.get((character_id, session_id))
+    if session_memories is None:
         return {"success": True, "memories": [], "total": 0}
     
-    memories = list(memories_db[character_id][session_id].values())
+    memories = list(session_memories.values())
     query_lower = search_data.query.lower()
     
     # 搜索匹配
@@ -253,7 +338,7 @@ async def search_memories(
                 score += 1
         
         if score > 0:
-            memory_dict = memory.dict()
+            memory_dict = asdict(memory)
             memory_dict["relevance_score"] = score
             matching_memories.append(memory_dict)
     
@@ -270,7 +355,8 @@ async def search_memories(
 @router.get("/statistics/{character_id}/{session_id}")
 async def get_memory_statistics(character_id: str, session_id: str):
     """获取记忆统计信息"""
-    if character_id not in memories_db or session_id not in memories_db[character_id]:
+    session_memories = memories_db.get((character_id, session_id))
+    if session_memories is None:
         return {
             "success": True,
             "statistics": {
@@ -283,17 +369,22 @@ async def get_memory_statistics(character_id: str, session_id: str):
             }
         }
     
-    memories = list(memories_db[character_id][session_id].values())
+    memories = list(session_memories.values())
     
-    # 按类型统计
+    # 单次遍历统计类型、重要性、关键词和情感（每条记忆只取一次枚举值）
     by_type = {}
-    for memory in memories:
-        by_type[memory.type.value] = by_type.get(memory.type.value, 0) + 1
-    
-    # 按重要性统计
     by_importance = {}
+    keyword_count = {}
+    emotion_count = {}
     for memory in memories:
-        by_importance[memory.importance.value] = by_importance.get(memory.importance.value, 0) + 1
+        type_value = memory.type.value
+        importance_value = memory.importance.value
+        by_type[type_value] = by_type.get(type_value, 0) + 1
+        by_importance[importance_value] = by_importance.get(importance_value, 0) + 1
+        for keyword in memory.keywords:
+            keyword_count[keyword] = keyword_count.get(keyword, 0) + 1
+        for emotion in memory.emotions:
+            emotion_count[emotion] = emotion_count.get(emotion, 0) + 1
     
     # 近期活动
     recent_memories = sorted(memories, key=lambda x: x.created_at, reverse=True)[:10]
@@ -307,19 +398,8 @@ async def get_memory_statistics(character_id: str, session_id: str):
     ]
     
     # 热门关键词
-    keyword_count = {}
-    for memory in memories:
-        for keyword in memory.keywords:
-            keyword_count[keyword] = keyword_count.get(keyword, 0) + 1
-    
     top_keywords = sorted(keyword_count.items(), key=lambda x: x[1], reverse=True)[:10]
     
-    # 情感分布
-    emotion_count = {}
-    for memory in memories:
-        for emotion in memory.emotions:
-            emotion_count[emotion] = emotion_count.get(emotion, 0) + 1
-    
     return {
         "success": True,
         "statistics": {
@@ -339,50 +419,57 @@ async def get_memory_timeline(
     days: int = Query(30, le=365)
 ):
     """获取记忆时间线"""
-    if character_id not in memories_db or session_id not in memories_db[character_id]:
+    session_memories = memories_db.get((character_id, session_id))
+    if session_memories is None:
         return {"success": True, "timeline": []}
     
-    memories = list(memories_db[character_id][session_id].values())
+    # 按日期分组（只保存记录引用，序列化推迟到流式输出时）
+    timeline_data: Dict[str, List[MemoryRecord]] = {}
+    for memory in session_memories.values():
+        timeline_data.setdefault(memory.created_at[:10], []).append(memory)  # YYYY-MM-DD
     
-    # 按日期分组
-    timeline_data = {}
-    for memory in memories:
-        date_str = memory.created_at[:10]  # YYYY-MM-DD
-        if date_str not in timeline_data:
-            timeline_data[date_str] = []
-        
-        timeline_data[date_str].append({
-            "id": memory.id,
-            "type": memory.type.value,
-            "importance": memory.importance.value,
-            "content": memory.content,
-            "time": memory.created_at,
-            "keywords": memory.keywords,
-            "emotions": memory.emotions
-        })
+    days_sorted = sorted(timeline_data.items(), reverse=True)
     
-    # 转换为时间线格式
-    timeline = []
-    for date, day_memories in sorted(timeline_data.items(), reverse=True):
-        timeline.append({
+    return StreamingResponse(
+        _stream_timeline(days_sorted[:days], len(days_sorted)),
+        media_type="application/json"
+    )
+
+async def _stream_timeline(
+    days_sorted: List[Tuple[str, List[MemoryRecord]]],
+    total_days: int
+) -> AsyncGenerator[bytes, None]:
+    """逐日序列化时间线，避免一次性构建完整响应"""
+    yield b'{"success": true, "timeline": ['
+    for index, (date, day_memories) in enumerate(days_sorted):
+        day_memories = sorted(day_memories, key=lambda x: x.created_at, reverse=True)
+        chunk = json.dumps({
             "date": date,
-            "memories": sorted(day_memories, key=lambda x: x["time"], reverse=True),
+            "memories": [
+                {
+                    "id": memory.id,
+                    "type": memory.type.value,
+                    "importance": memory.importance.value,
+                    "content": memory.content,
+                    "time": memory.created_at,
+                    "keywords": memory.keywords,
+                    "emotions": memory.emotions
+                }
+                for memory in day_memories
+            ],
             "count": len(day_memories)
-        })
-    
-    return {
-        "success": True,
-        "timeline": timeline[:days],
-        "total_days": len(timeline)
-    }
+        }, ensure_ascii=False).encode("utf-8")
+        yield chunk if index == 0 else b", " + chunk
+    yield f'], "total_days": {total_days}}}'.encode("utf-8")
 
 @router.get("/insights/{character_id}/{session_id}")
 async def get_memory_insights(character_id: str, session_id: str):
     """获取记忆洞察分析"""
-    if character_id not in memories_db or session_id not in memories_db[character_id]:
+    session_memories = memories_db.get((character_id, session_id))
+    if session_memories is None:
         return {"success": True, "insights": {}}
     
-    memories = list(memories_db[character_id][session_id].values())
+    memories = list(session_memories.values())
     
     # 分析用户画像
     user_profile = {
@@ -416,9 +503,9 @@ async def get_memory_insights(character_id: str, session_id: str):
     # 记忆质量评估
     quality_metrics = {
         "completeness": min(len(memories) / 50.0, 1.0),  # 记忆完整性
-        "diversity": len(set(mem.type for mem in memories)) / len(MemoryType),  # 记忆多样性
+        "diversity": len(set(mem.type for mem in memories)) / MEMORY_TYPE_COUNT,  # 记忆多样性
         "recency": sum(1 for mem in memories if (datetime.now() - datetime.fromisoformat(mem.created_at.replace('Z', '+00:00'))).days <= 7) / max(len(memories), 1),  # 记忆新鲜度
-        "depth": sum(1 for mem in memories if mem.importance in [MemoryImportance.HIGH, MemoryImportance.CRITICAL]) / max(len(memories), 1)  # 记忆深度
+        "depth": sum(1 for mem in memories if mem.importance in HIGH_IMPORTANCE_LEVELS) / max(len(memories), 1)  # 记忆深度
     }
     
     return {
@@ -7,7 +7,9 @@ from fastapi.websockets import WebSocketState
 import json
 import asyncio
 import logging
-from typing import Dict, List
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
 from datetime import datetime
 
 logger = logging.getLogger(__name__)
@@ -15,36 +17,47 @@ logger = logging.getLogger(__name__)
 # WebSocket路由器
 router = APIRouter()
 
+@dataclass(slots=True)
+class Connection:
+    """单个WebSocket连接的状态"""
+    websocket: WebSocket
+    user_id: Optional[str] = None
+    last_seen: float = field(default_factory=time.monotonic)
+
 # 连接管理器
 class ConnectionManager:
     def __init__(self):
-        self.active_connections: Dict[str, WebSocket] = {}
-        self.user_sessions: Dict[str, str] = {}  # websocket_id -> user_id
+        self.active_connections: Dict[str, Connection] = {}  # session_id -> 连接状态
     
-    async def connect(self, websocket: WebSocket, session_id: str):
+    async def connect(self, websocket: WebSocket, session_id: str, user_id: Optional[str] = None):
         """接受WebSocket连接"""
         await websocket.accept()
-        self.active_connections[session_id] = websocket
+        self.active_connections[session_id] = Connection(websocket=websocket, user_id=user_id)
         logger.info(f"WebSocket连接已建立: {session_id}")
     
     def disconnect(self, session_id: str):
         """断开WebSocket连接"""
-        if session_id in self.active_connections:
-            del self.active_connections[session_id]
-            if session_id in self.user_sessions:
-                del self.user_sessions[session_id]
+        if self.active_connections.pop(session_id, None) is not None:
             logger.info(f"WebSocket连接已断开: {session_id}")
     
     async def send_message(self, session_id: str, message: dict):
         """发送消息到指定连接"""
-        if session_id in self.active_connections:
-            websocket = self.active_connections[session_id]
-            if websocket.client_state == WebSocketState.CONNECTED:
-                try:
-                    await websocket.send_text(json.dumps(message, ensure_ascii=False))
-                except Exception as e:
-                    logger.error(f"发送消息失败: {e}")
-                    self.disconnect(session_id)
+        conn = self.active_connections.get(session_id)
+        if conn is None or conn.websocket.client_state != WebSocketState.CONNECTED:
+            return
+        try:
+            await conn.websocket.send_text(json.dumps(message, ensure_ascii=False))
+            conn.last_seen = time.monotonic()
+        except Exception as e:
+            logger.error(f"发送消息失败: {e}")
+            self.disconnect(session_id)
+    
+    async def broadcast(self, session_ids: List[str], message: dict):
+        """并发发送消息到多个连接"""
+        await asyncio.gather(
+            *(self.send_message(session_id, message) for session_id in session_ids),
+            return_exceptions=True
+        )
     
     async def send_streaming_response(self, session_id: str, character_id: str, response_text: str):
         """发送流式响应"""
@@ -60,17 +73,17 @@ class ConnectionManager:
         
         # 模拟逐字输出
         words = response_text.split()
-        current_text = ""
+        word_count = len(words)
+        last_index = word_count - 1
         
         for i, word in enumerate(words):
-            current_text += word + (" " if i < len(words) - 1 else "")
+            piece = word if i == last_index else word + " "
             
-            # 发送当前文本块
+            # 只发送增量文本块，完整内容在完成信号的 full_message 中
             await self.send_message(session_id, {
                 "type": "response_chunk",
                 "character_id": character_id,
-                "content": word + (" " if i < len(words) - 1 else ""),
-                "full_content": current_text,
+                "content": piece,
                 "is_complete": False,
                 "chunk_index": i,
                 "timestamp": datetime.now().isoformat()
@@ -86,8 +99,8 @@ class ConnectionManager:
             "full_message": response_text,
             "timestamp": datetime.now().isoformat(),
             "metadata": {
-                "total_chunks": len(words),
-                "response_time_ms": len(words) * 100,
+                "total_chunks": word_count,
+                "response_time_ms": word_count * 100,
                 "character_mood": "neutral"
             }
         })
@@ -136,16 +149,16 @@ async def handle_user_message(session_id: str, message_data: dict):
         "timestamp": datetime.now().isoformat()
     })
     
-    # 发送AI正在思考状态
-    await manager.send_message(session_id, {
-        "type": "ai_thinking",
-        "character_id": character_id,
-        "status": "thinking",
-        "timestamp": datetime.now().isoformat()
-    })
-    
-    # 模拟AI思考时间
-    await asyncio.sleep(1.5)
+    # 发送AI正在思考状态，同时开始模拟AI思考
+    await asyncio.gather(
+        manager.send_message(session_id, {
+            "type": "ai_thinking",
+            "character_id": character_id,
+            "status": "thinking",
+            "timestamp": datetime.now().isoformat()
+        }),
+        asyncio.sleep(1.5)
+    )
     
     # 生成角色回复（这里应该调用AI服务）
     character_responses = {
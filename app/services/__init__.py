@@ -4,7 +4,14 @@
 包含所有业务逻辑服务，包括LLM连接、角色加载、会话管理等。
 """
 
-from .llm_connector import LLMConnector, AbstractLLMProvider, GeminiProvider, DeepSeekProvider
+from .llm_connector import (
+    LLMConnector,
+    AbstractLLMProvider,
+    GeminiProvider,
+    DeepSeekProvider,
+    get_llm_connector,
+    close_llm_connector,
+)
 from .character_loader import CharacterLoader, character_loader
 from .session_manager import SessionManager, session_manager
 from .prompt_builder import PromptBuilder, prompt_builder
@@ -15,6 +22,8 @@ __all__ = [
     "AbstractLLMProvider", 
     "GeminiProvider",
     "DeepSeekProvider",
+    "get_llm_connector",
+    "close_llm_connector",
     
     # 角色加载服务
     "CharacterLoader",
@@ -7,14 +7,84 @@
 import os
 import json
 import asyncio
-from datetime import datetime, timedelta
-from typing import Dict, List, Optional
+from datetime import datetime
+from functools import lru_cache
+from typing import Dict, List, Optional, Any, Set, Tuple
 from pathlib import Path
-import aiofiles
 
 from app.core import settings, CharacterNotFoundError, CharacterLoadError
 from app.models import Character, CharacterSummary
 
+try:
+    import orjson
+
+    def _json_loads(content: bytes) -> Any:
+        return orjson.loads(content)
+
+    def _json_dumps(data: Dict[str, Any]) -> bytes:
+        return orjson.dumps(data, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)
+
+except ImportError:
+    def _json_loads(content: bytes) -> Any:
+        return json.loads(content)
+
+    def _json_dumps(data: Dict[str, Any]) -> bytes:
+        return json.dumps(data, ensure_ascii=False, indent=2).encode('utf-8')
+
+
+def _read_json_sync(path: Path) -> Tuple[Dict[str, Any], os.stat_result]:
+    """
+    同步读取并解析JSON文件（在线程池中执行）
+    
+    Args:
+        path: 文件路径
+        
+    Returns:
+        Tuple[Dict[str, Any], os.stat_result]: 解析后的数据和文件状态
+    """
+    with open(path, 'rb') as f:
+        content = f.read()
+        stat = os.fstat(f.fileno())
+    return _json_loads(content), stat
+
+
+def _write_json_sync(path: Path, data: Dict[str, Any]) -> os.stat_result:
+    """
+    同步写入JSON文件（在线程池中执行）
+    
+    Args:
+        path: 文件路径
+        data: 要写入的数据
+        
+    Returns:
+        os.stat_result: 写入后的文件状态
+    """
+    with open(path, 'wb') as f:
+        f.write(_json_dumps(data))
+    return os.stat(path)
+
+
+@lru_cache(maxsize=1024)
+def _character_file_path(characters_dir: Path, character_id: str) -> Path:
+    """
+    获取角色配置文件路径（结果缓存）
+    
+    Args:
+        characters_dir: 角色目录
+        character_id: 角色ID
+        
+    Returns:
+        Path: 文件路径
+    """
+    return characters_dir / f"{character_id}.json"
+
+
+# 加载角色列表时同时读取的最大文件数
+LIST_LOAD_CONCURRENCY = 8
+
+# 不存在角色缓存的最大条目数，超出后整体清空
+MISSING_CACHE_MAXSIZE = 1024
+
 
 class CharacterLoader:
     """
@@ -23,24 +93,37 @@ class CharacterLoader:
     提供角色配置的加载、缓存和管理功能。
     """
     
+    # 已确保存在的角色目录（所有实例共享）
+    _created_dirs: Set[Path] = set()
+    
     def __init__(self):
         self.characters_dir = Path(settings.characters_dir)
         self.cache_enabled = settings.enable_character_cache
-        self.cache_ttl = settings.character_cache_ttl
         
         # 角色缓存
         self._character_cache: Dict[str, Character] = {}
-        self._cache_timestamps: Dict[str, datetime] = {}
+        self._cache_meta: Dict[str, Tuple[int, int]] = {}  # character_id -> (st_mtime_ns, st_size)
+        self._summary_cache: Dict[str, CharacterSummary] = {}
         self._character_list_cache: Optional[List[CharacterSummary]] = None
         self._list_cache_timestamp: Optional[datetime] = None
+        self._list_dir_mtime_ns: Optional[int] = None
+        self._list_character_ids: List[str] = []
         
-        # 确保角色目录存在
-        self.characters_dir.mkdir(parents=True, exist_ok=True)
+        # 已确认不存在的角色ID，避免重复的文件系统查询
+        self._missing: Set[str] = set()
+    
+    def _ensure_dir(self) -> None:
+        """确保角色目录存在（每个目录只创建一次）"""
+        if self.characters_dir not in self._created_dirs:
+            self.characters_dir.mkdir(parents=True, exist_ok=True)
+            self._created_dirs.add(self.characters_dir)
     
     def _is_cache_valid(self, character_id: str) -> bool:
         """
         检查角色缓存是否有效
         
+        缓存记录加载时文件的修改时间和大小，文件未变化时缓存始终有效。
+        
         Args:
             character_id: 角色ID
             
@@ -50,26 +133,86 @@ class CharacterLoader:
         if not self.cache_enabled:
             return False
         
-        if character_id not in self._cache_timestamps:
+        cache_meta = self._cache_meta.get(character_id)
+        if cache_meta is None:
             return False
         
-        cache_time = self._cache_timestamps[character_id]
-        expiry_time = cache_time + timedelta(seconds=self.cache_ttl)
+        try:
+            stat = os.stat(self._get_character_file_path(character_id))
+        except OSError:
+            return False
         
-        return datetime.now() < expiry_time
+        return cache_meta == (stat.st_mtime_ns, stat.st_size)
+    
+    def _mark_missing(self, character_id: str) -> None:
+        """
+        记录不存在的角色ID
+        
+        Args:
+            character_id: 角色ID
+        """
+        if not self.cache_enabled:
+            return
+        if len(self._missing) >= MISSING_CACHE_MAXSIZE:
+            self._missing.clear()
+        self._missing.add(character_id)
+    
+    def _update_cache(self, character_id: str, character: Character, stat: os.stat_result) -> None:
+        """
+        更新角色缓存
+        
+        Args:
+            character_id: 角色ID
+            character: 角色对象
+            stat: 角色文件状态
+        """
+        if self.cache_enabled:
+            self._character_cache[character_id] = character
+            self._cache_meta[character_id] = (stat.st_mtime_ns, stat.st_size)
+            self._summary_cache[character_id] = self._build_summary(character)
+    
+    @staticmethod
+    def _build_summary(character: Character) -> CharacterSummary:
+        """
+        创建角色摘要
+        
+        Args:
+            character: 角色对象
+            
+        Returns:
+            CharacterSummary: 角色摘要
+        """
+        return CharacterSummary(
+            id=character.id,
+            name=character.name,
+            type=character.type,
+            description=character.description,
+            avatar_url=character.avatar_url,
+            tags=character.tags
+        )
     
     def _is_list_cache_valid(self) -> bool:
         """
         检查角色列表缓存是否有效
         
+        目录修改时间未变（没有增删文件）且列表中每个角色的缓存仍有效时，
+        列表缓存有效，无需重新遍历目录。
+        
         Returns:
             bool: 缓存是否有效
         """
-        if not self.cache_enabled or not self._list_cache_timestamp:
+        if not self.cache_enabled or self._character_list_cache is None:
             return False
         
-        expiry_time = self._list_cache_timestamp + timedelta(seconds=self.cache_ttl)
-        return datetime.now() < expiry_time
+        try:
+            dir_mtime_ns = os.stat(self.characters_dir).st_mtime_ns
+        except OSError:
+            return False
+        
+        if dir_mtime_ns != self._list_dir_mtime_ns:
+            return False
+        
+        return all(self._is_cache_valid(character_id) for character_id in self._list_character_ids)
     
     def _get_character_file_path(self, character_id: str) -> Path:
         """
@@ -81,7 +224,7 @@ class CharacterLoader:
         Returns:
             Path: 文件路径
         """
-        return self.characters_dir / f"{character_id}.json"
+        return _character_file_path(self.characters_dir, character_id)
     
     async def _load_character_from_file(self, character_id: str) -> Character:
         """
@@ -99,18 +242,18 @@ class CharacterLoader:
         """
         file_path = self._get_character_file_path(character_id)
         
-        # 检查文件是否存在
-        if not file_path.exists():
+        try:
+            # 在线程池中一次性完成读取、解析和stat
+            character_data, stat = await asyncio.to_thread(_read_json_sync, file_path)
+        except FileNotFoundError:
+            self._mark_missing(character_id)
             raise CharacterNotFoundError(character_id)
+        except json.JSONDecodeError as e:
+            raise CharacterLoadError(character_id, f"JSON解析错误: {e}")
+        except Exception as e:
+            raise CharacterLoadError(character_id, f"文件读取错误: {e}")
         
         try:
-            # 异步读取文件
-            async with aiofiles.open(file_path, 'r', encoding='utf-8') as f:
-                content = await f.read()
-            
-            # 解析JSON
-            character_data = json.loads(content)
-            
             # 验证和创建Character对象
             character = Character(**character_data)
             
@@ -119,19 +262,18 @@ class CharacterLoader:
             
             # 设置时间戳（如果没有的话）
             if not character.created_at:
-                stat = file_path.stat()
                 character.created_at = datetime.fromtimestamp(stat.st_ctime).isoformat()
             
             if not character.updated_at:
-                stat = file_path.stat()
                 character.updated_at = datetime.fromtimestamp(stat.st_mtime).isoformat()
             
-            return character
-            
-        except json.JSONDecodeError as e:
-            raise CharacterLoadError(character_id, f"JSON解析错误: {e}")
         except Exception as e:
             raise CharacterLoadError(character_id, f"文件读取错误: {e}")
+        
+        # 更新缓存
+        self._update_cache(character_id, character, stat)
+        
+        return character
     
     async def get_character(self, character_id: str) -> Character:
         """
@@ -148,18 +290,30 @@ class CharacterLoader:
             CharacterLoadError: 角色加载失败
         """
         # 检查缓存
+        if character_id in self._missing:
+            raise CharacterNotFoundError(character_id)
         if self._is_cache_valid(character_id):
             return self._character_cache[character_id]
         
-        # 从文件加载
-        character = await self._load_character_from_file(character_id)
+        # 从文件加载（同时更新缓存）
+        return await self._load_character_from_file(character_id)
+    
+    async def _get_character_bounded(self, character_id: str, semaphore: asyncio.Semaphore) -> Character:
+        """
+        在信号量限制下获取角色（优先使用缓存）
         
-        # 更新缓存
-        if self.cache_enabled:
-            self._character_cache[character_id] = character
-            self._cache_timestamps[character_id] = datetime.now()
+        Args:
+            character_id: 角色ID
+            semaphore: 并发限制信号量
+            
+        Returns:
+            Character: 角色对象
+        """
+        if self._is_cache_valid(character_id):
+            return self._character_cache[character_id]
         
-        return character
+        async with semaphore:
+            return await self._load_character_from_file(character_id)
     
     async def get_character_list(self) -> List[CharacterSummary]:
         """
@@ -174,38 +328,38 @@ class CharacterLoader:
         
         character_summaries = []
         
-        # 遍历角色目录
-        if self.characters_dir.exists():
-            for file_path in self.characters_dir.glob("*.json"):
-                character_id = file_path.stem
-                
-                try:
-                    # 尝试从缓存获取
-                    if self._is_cache_valid(character_id):
-                        character = self._character_cache[character_id]
-                    else:
-                        character = await self._load_character_from_file(character_id)
-                        
-                        # 更新缓存
-                        if self.cache_enabled:
-                            self._character_cache[character_id] = character
-                            self._cache_timestamps[character_id] = datetime.now()
-                    
-                    # 创建摘要
-                    summary = CharacterSummary(
-                        id=character.id,
-                        name=character.name,
-                        type=character.type,
-                        description=character.description,
-                        avatar_url=character.avatar_url,
-                        tags=character.tags
-                    )
-                    character_summaries.append(summary)
-                    
-                except Exception as e:
-                    # 记录错误但不中断整个列表加载
-                    print(f"加载角色 {character_id} 时出错: {e}")
-                    continue
+        # 遍历角色目录（scandir复用readdir返回的类型信息，无需逐个stat）
+        character_ids = []
+        dir_mtime_ns = None
+        try:
+            dir_mtime_ns = os.stat(self.characters_dir).st_mtime_ns
+            with os.scandir(self.characters_dir) as entries:
+                character_ids = [
+                    entry.name[:-5] for entry in entries
+                    if entry.name.endswith(".json") and entry.is_file()
+                ]
+        except FileNotFoundError:
+            pass
+        
+        # 并发加载角色，信号量限制同时读取的文件数
+        semaphore = asyncio.Semaphore(LIST_LOAD_CONCURRENCY)
+        results = await asyncio.gather(
+            *(self._get_character_bounded(character_id, semaphore) for character_id in character_ids),
+            return_exceptions=True
+        )
+        
+        for character_id, character in zip(character_ids, results):
+            self._missing.discard(character_id)
+            if isinstance(character, Exception):
+                # 记录错误但不中断整个列表加载
+                print(f"加载角色 {character_id} 时出错: {character}")
+                continue
+            
+            # 优先使用加载时缓存的摘要
+            summary = self._summary_cache.get(character_id)
+            if summary is None:
+                summary = self._build_summary(character)
+            character_summaries.append(summary)
         
         # 按名称排序
         character_summaries.sort(key=lambda x: x.name)
@@ -214,6 +368,8 @@ class CharacterLoader:
         if self.cache_enabled:
             self._character_list_cache = character_summaries
             self._list_cache_timestamp = datetime.now()
+            self._list_dir_mtime_ns = dir_mtime_ns
+            self._list_character_ids = character_ids
         
         return character_summaries
     
@@ -228,12 +384,18 @@ class CharacterLoader:
             bool: 角色是否存在
         """
         # 先检查缓存
+        if character_id in self._missing:
+            return False
         if character_id in self._character_cache and self._is_cache_valid(character_id):
             return True
         
         # 检查文件是否存在
         file_path = self._get_character_file_path(character_id)
-        return file_path.exists()
+        if file_path.exists():
+            return True
+        
+        self._mark_missing(character_id)
+        return False
     
     async def save_character(self, character: Character) -> None:
         """
@@ -254,16 +416,16 @@ class CharacterLoader:
             # 转换为字典
             character_data = character.dict()
             
-            # 异步写入文件
-            async with aiofiles.open(file_path, 'w', encoding='utf-8') as f:
-                await f.write(json.dumps(character_data, ensure_ascii=False, indent=2))
+            # 在线程池中写入文件
+            self._ensure_dir()
+            stat = await asyncio.to_thread(_write_json_sync, file_path, character_data)
+            self._missing.discard(character.id)
             
             # 更新缓存
             if self.cache_enabled:
-                self._character_cache[character.id] = character
-                self._cache_timestamps[character.id] = datetime.now()
+                self._update_cache(character.id, character, stat)
                 
-                # 清除列表缓存，因为可能有新角色
+                # 清除列表缓存：覆盖已有文件不会改变目录修改时间
                 self._character_list_cache = None
                 self._list_cache_timestamp = None
                 
@@ -289,12 +451,10 @@ class CharacterLoader:
             # 清除缓存
             if character_id in self._character_cache:
                 del self._character_cache[character_id]
-            if character_id in self._cache_timestamps:
-                del self._cache_timestamps[character_id]
-            
-            # 清除列表缓存
-            self._character_list_cache = None
-            self._list_cache_timestamp = None
+            if character_id in self._cache_meta:
+                del self._cache_meta[character_id]
+            self._summary_cache.pop(character_id, None)
+            self._mark_missing(character_id)
             
             return True
             
@@ -313,12 +473,16 @@ class CharacterLoader:
             # 清除指定角色缓存
             if character_id in self._character_cache:
                 del self._character_cache[character_id]
-            if character_id in self._cache_timestamps:
-                del self._cache_timestamps[character_id]
+            if character_id in self._cache_meta:
+                del self._cache_meta[character_id]
+            self._summary_cache.pop(character_id, None)
+            self._missing.discard(character_id)
         else:
             # 清除所有缓存
             self._character_cache.clear()
-            self._cache_timestamps.clear()
+            self._cache_meta.clear()
+            self._summary_cache.clear()
+            self._missing.clear()
             self._character_list_cache = None
             self._list_cache_timestamp = None
     
@@ -331,7 +495,6 @@ class CharacterLoader:
         """
         return {
             "cache_enabled": self.cache_enabled,
-            "cache_ttl": self.cache_ttl,
             "cached_characters": len(self._character_cache),
             "character_ids": list(self._character_cache.keys()),
             "list_cached": self._character_list_cache is not None,
@@ -5,14 +5,22 @@
 """
 
 import logging
+from collections import deque
 from typing import Dict, List, Optional, Any, Tuple, Set
 from datetime import datetime, timedelta
 from enum import Enum
 from dataclasses import dataclass
+from functools import lru_cache
+from itertools import repeat
+from types import MappingProxyType
 
 from app.models import Character
 
 
+# 内存中保留的最大互动记录数
+MAX_INTERACTION_RECORDS = 10000
+
+
 class RelationshipType(Enum):
     """关系类型枚举"""
     NEUTRAL = "neutral"         # 中性关系
@@ -35,7 +43,24 @@ class InteractionType(Enum):
     COMPETITION = "competition"    # 竞争
 
 
-@dataclass
+# 性格兼容性矩阵（简化版）
+PERSONALITY_COMPATIBILITY = MappingProxyType({
+    "活泼开朗": MappingProxyType({"冷淡": -20, "内敛": -10, "活泼开朗": 30, "温柔": 20}),
+    "冷淡": MappingProxyType({"活泼开朗": -20, "强势": -15, "冷淡": 10, "神秘": 15}),
+    "强势好胜": MappingProxyType({"温柔": 10, "强势好胜": -10, "冷淡": -5, "活泼开朗": 15}),
+    "温柔": MappingProxyType({"强势好胜": 10, "冷淡": 5, "温柔": 25, "活泼开朗": 20}),
+    "神秘莫测": MappingProxyType({"冷淡": 15, "神秘莫测": 5, "活泼开朗": -10})
+})
+
+# 潜在冲突组合：(一方特质, 另一方特质, 冲突描述)
+CONFLICT_COMBINATIONS = (
+    (frozenset({"强势好胜", "骄傲"}), frozenset({"强势好胜", "骄傲"}), "双方都很强势，可能产生竞争冲突"),
+    (frozenset({"冷淡", "疏离"}), frozenset({"活泼开朗", "热情"}), "性格反差较大，可能产生理解困难"),
+    (frozenset({"固执", "倔强"}), frozenset({"固执", "倔强"}), "双方都很固执，容易产生意见分歧")
+)
+
+
+@dataclass(slots=True)
 class CharacterRelationship:
     """角色关系数据结构"""
     character_a_id: str
@@ -52,7 +77,7 @@ class CharacterRelationship:
     updated_at: datetime
 
 
-@dataclass
+@dataclass(slots=True)
 class InteractionRecord:
     """互动记录数据结构"""
     id: str
@@ -71,9 +96,17 @@ class CharacterRelationshipManager:
     def __init__(self):
         self.logger = logging.getLogger(__name__)
         # 存储角色关系
-        self._relationships: Dict[str, CharacterRelationship] = {}
-        # 存储互动记录
-        self._interactions: List[InteractionRecord] = []
+        self._relationships: Dict[Tuple[str, str], CharacterRelationship] = {}
+        # 角色ID -> 相关关系键（按创建顺序）
+        self._relationships_by_character: Dict[str, List[Tuple[str, str]]] = {}
+        # 存储最近的互动记录（环形缓冲）和累计互动数
+        self._interactions: "deque[InteractionRecord]" = deque(maxlen=MAX_INTERACTION_RECORDS)
+        self._total_interactions = 0
+        # 关系网络摘要缓存，关系变更时标记失效
+        self._network_summary: Optional[Dict[str, Any]] = None
+        self._network_summary_dirty = True
+        # 关系数据版本号，每次关系或互动变更时递增，供外部缓存判断是否失效
+        self.version = 0
         
         # 预定义的角色关系（基于动漫设定）
         self.predefined_relationships = {
@@ -96,6 +129,11 @@ class CharacterRelationshipManager:
                 "notes": ["都很有活力", "可能会因为音乐话题产生共鸣"]
             }
         }
+        # 以规范关系键索引的预定义关系（与角色顺序无关）
+        self._predefined_by_key = {
+            self._get_relationship_key(char_a, char_b): config
+            for (char_a, char_b), config in self.predefined_relationships.items()
+        }
         
         # 关系影响因子
         self.relationship_factors = {
@@ -124,7 +162,7 @@ class CharacterRelationshipManager:
             relationship_key = self._get_relationship_key(char_a, char_b)
             
             if relationship_key not in self._relationships:
-                self._relationships[relationship_key] = CharacterRelationship(
+                self._add_relationship(relationship_key, CharacterRelationship(
                     character_a_id=char_a,
                     character_b_id=char_b,
                     relationship_type=config["type"],
@@ -134,14 +172,26 @@ class CharacterRelationshipManager:
                     positive_interactions=0,
                     negative_interactions=0,
                     last_interaction=now,
-                    relationship_notes=config["notes"],
+                    relationship_notes=list(config["notes"]),
                     created_at=now,
                     updated_at=now
-                )
+                ))
+    
+    def _add_relationship(self, relationship_key: Tuple[str, str], relationship: CharacterRelationship):
+        """添加新关系并更新角色索引"""
+        self._relationships[relationship_key] = relationship
+        self._network_summary_dirty = True
+        self.version += 1
+        for character_id in {relationship.character_a_id, relationship.character_b_id}:
+            self._relationships_by_character.setdefault(character_id, []).append(relationship_key)
     
-    def _get_relationship_key(self, char_a_id: str, char_b_id: str) -> str:
-        """生成关系键值（确保一致性）"""
-        return f"{min(char_a_id, char_b_id)}_{max(char_a_id, char_b_id)}"
+    @staticmethod
+    @lru_cache(maxsize=4096)
+    def _get_relationship_key(char_a_id: str, char_b_id: str) -> Tuple[str, str]:
+        """生成关系键值（与角色顺序无关）"""
+        if char_a_id <= char_b_id:
+            return (char_a_id, char_b_id)
+        return (char_b_id, char_a_id)
     
     def get_relationship(
         self, 
@@ -194,6 +244,9 @@ class CharacterRelationshipManager:
             timestamp=now
         )
         self._interactions.append(interaction)
+        self._total_interactions += 1
+        self._network_summary_dirty = True
+        self.version += 1
         
         # 获取或创建关系
         if relationship_key in self._relationships:
@@ -214,7 +267,7 @@ class CharacterRelationshipManager:
                 created_at=now,
                 updated_at=now
             )
-            self._relationships[relationship_key] = relationship
+            self._add_relationship(relationship_key, relationship)
         
         # 更新关系数据
         relationship.interaction_count += 1
@@ -251,16 +304,8 @@ class CharacterRelationshipManager:
             relationship.character_b_id
         )
         
-        if (relationship.character_a_id, relationship.character_b_id) in self.predefined_relationships:
-            base_type = self.predefined_relationships[
-                (relationship.character_a_id, relationship.character_b_id)
-            ]["type"]
-        elif (relationship.character_b_id, relationship.character_a_id) in self.predefined_relationships:
-            base_type = self.predefined_relationships[
-                (relationship.character_b_id, relationship.character_a_id)
-            ]["type"]
-        else:
-            base_type = RelationshipType.NEUTRAL
+        predefined = self._predefined_by_key.get(rel_key)
+        base_type = predefined["type"] if predefined else RelationshipType.NEUTRAL
         
         # 根据互动调整关系类型
         if affinity > 70 and trust > 80:
@@ -282,14 +327,10 @@ class CharacterRelationshipManager:
     
     def get_character_relationships(self, character_id: str) -> List[CharacterRelationship]:
         """获取某个角色的所有关系"""
-        relationships = []
-        
-        for relationship in self._relationships.values():
-            if (relationship.character_a_id == character_id or 
-                relationship.character_b_id == character_id):
-                relationships.append(relationship)
-        
-        return relationships
+        return [
+            self._relationships[relationship_key]
+            for relationship_key in self._relationships_by_character.get(character_id, ())
+        ]
     
     def get_relationship_context_for_prompt(
         self,
@@ -433,24 +474,17 @@ class CharacterRelationshipManager:
         traits_b: List[str]
     ) -> float:
         """计算性格兼容性"""
-        # 兼容性矩阵（简化版）
-        compatibility_matrix = {
-            "活泼开朗": {"冷淡": -20, "内敛": -10, "活泼开朗": 30, "温柔": 20},
-            "冷淡": {"活泼开朗": -20, "强势": -15, "冷淡": 10, "神秘": 15},
-            "强势好胜": {"温柔": 10, "强势好胜": -10, "冷淡": -5, "活泼开朗": 15},
-            "温柔": {"强势好胜": 10, "冷淡": 5, "温柔": 25, "活泼开朗": 20},
-            "神秘莫测": {"冷淡": 15, "神秘莫测": 5, "活泼开朗": -10}
-        }
-        
         total_score = 0
-        comparisons = 0
+        known_traits_a = 0
         
+        # 只有矩阵中定义的特质参与比较，每行用map在C层完成对traits_b的查表求和
         for trait_a in traits_a:
-            for trait_b in traits_b:
-                if trait_a in compatibility_matrix:
-                    score = compatibility_matrix[trait_a].get(trait_b, 0)
-                    total_score += score
-                    comparisons += 1
+            row = PERSONALITY_COMPATIBILITY.get(trait_a)
+            if row is not None:
+                total_score += sum(map(row.get, traits_b, repeat(0)))
+                known_traits_a += 1
+        
+        comparisons = known_traits_a * len(traits_b)
         
         return total_score / max(1, comparisons)
     
@@ -493,35 +527,34 @@ class CharacterRelationshipManager:
         """识别潜在冲突点"""
         conflicts = []
         
-        conflict_combinations = [
-            (["强势好胜", "骄傲"], ["强势好胜", "骄傲"], "双方都很强势，可能产生竞争冲突"),
-            (["冷淡", "疏离"], ["活泼开朗", "热情"], "性格反差较大，可能产生理解困难"),
-            (["固执", "倔强"], ["固执", "倔强"], "双方都很固执，容易产生意见分歧")
-        ]
-        
-        for traits_x, traits_y, conflict_desc in conflict_combinations:
-            if (any(t in traits_a for t in traits_x) and any(t in traits_b for t in traits_y)) or \
-               (any(t in traits_b for t in traits_x) and any(t in traits_a for t in traits_y)):
+        for traits_x, traits_y, conflict_desc in CONFLICT_COMBINATIONS:
+            if (not traits_x.isdisjoint(traits_a) and not traits_y.isdisjoint(traits_b)) or \
+               (not traits_x.isdisjoint(traits_b) and not traits_y.isdisjoint(traits_a)):
                 conflicts.append(conflict_desc)
         
         return conflicts
     
     def get_relationship_network_summary(self) -> Dict[str, Any]:
-        """获取关系网络摘要"""
+        """获取关系网络摘要（关系变更前复用缓存结果，返回副本以免调用方改动缓存）"""
+        if self._network_summary_dirty or self._network_summary is None:
+            self._network_summary = self._build_network_summary()
+            self._network_summary_dirty = False
+        
+        summary = self._network_summary
+        return {**summary, "relationship_types": dict(summary["relationship_types"])}
+    
+    def _build_network_summary(self) -> Dict[str, Any]:
+        """统计关系网络摘要"""
         total_relationships = len(self._relationships)
         
-        # 按类型统计
+        # 单次遍历：按类型统计并找出最活跃的关系
         type_counts = {}
+        most_interactive = None
         for rel in self._relationships.values():
             rel_type = rel.relationship_type.value
             type_counts[rel_type] = type_counts.get(rel_type, 0) + 1
-        
-        # 找出最活跃的关系
-        most_interactive = max(
-            self._relationships.values(),
-            key=lambda r: r.interaction_count,
-            default=None
-        )
+            if most_interactive is None or rel.interaction_count > most_interactive.interaction_count:
+                most_interactive = rel
         
         return {
             "total_relationships": total_relationships,
@@ -530,6 +563,6 @@ class CharacterRelationshipManager:
                 f"{most_interactive.character_a_id} & {most_interactive.character_b_id}"
                 if most_interactive else None
             ),
-            "total_interactions": len(self._interactions),
+            "total_interactions": self._total_interactions,
             "network_density": total_relationships / max(1, (3 * 2 / 2))  # 假设3个角色的完全图
-        } 
\ No newline at end of file
+        }
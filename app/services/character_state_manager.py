@@ -5,12 +5,35 @@
 """
 
 import logging
-from typing import Dict, List, Optional, Any, Tuple
+from bisect import bisect_right
+from collections import OrderedDict, deque
+from typing import Deque, Dict, List, Optional, Any, Tuple
 from datetime import datetime, timedelta
 from enum import Enum
 from dataclasses import dataclass
+from itertools import islice
+from types import MappingProxyType
 
 from app.models import Character, Message, Session
+from app.services.keyword_matching import compile_keyword_pattern, compile_keywords, match_keywords
+
+
+# 内存中保留的最大会话状态数
+MAX_CHARACTER_STATES = 10000
+
+# 每个会话保留的最大特殊记忆数
+MAX_SPECIAL_MEMORIES = 10
+
+# 没有配置数据的角色共用的空配置（固定对象，使按配置对象缓存的结果可以命中）
+EMPTY_CONFIG = MappingProxyType({})
+
+# 特殊记忆触发词
+SPECIAL_INDICATORS = (
+    "我喜欢你", "我爱你", "生日", "重要", "秘密",
+    "第一次", "特别", "难忘", "永远", "承诺"
+)
+SPECIAL_INDICATOR_PATTERN = compile_keywords(SPECIAL_INDICATORS)
+SPECIAL_INDICATOR_FIRST_CHARS = frozenset(indicator[0] for indicator in SPECIAL_INDICATORS)
 
 
 class RelationshipLevel(Enum):
@@ -31,7 +54,40 @@ class CharacterMood(Enum):
     TERRIBLE = "terrible"   # 很糟
 
 
-@dataclass
+# 心情从低到高的顺序，以及每种心情在其中的位置
+MOOD_ORDER = (
+    CharacterMood.TERRIBLE,
+    CharacterMood.BAD,
+    CharacterMood.NEUTRAL,
+    CharacterMood.GOOD,
+    CharacterMood.GREAT
+)
+MOOD_RANK = {mood: rank for rank, mood in enumerate(MOOD_ORDER)}
+MAX_MOOD_RANK = len(MOOD_ORDER) - 1
+
+# 各心情对目标活力值的修正，按 MOOD_ORDER 顺序排列
+MOOD_ENERGY_MODIFIERS = (-10, -5, 0, 5, 10)
+
+# 提示词中的关系状态修饰
+RELATIONSHIP_PROMPT_TEXTS = {
+    RelationshipLevel.STRANGER: "这是你们的初次相遇，保持适当的距离和礼貌。",
+    RelationshipLevel.ACQUAINTANCE: "你们已经认识了，可以稍微亲近一些。",
+    RelationshipLevel.FRIEND: "你们已经是朋友了，可以更加自在和亲密。",
+    RelationshipLevel.CLOSE_FRIEND: "你们是很好的朋友，可以分享更多私人想法。",
+    RelationshipLevel.SPECIAL: "你们有着特殊的关系，可以表现出更深层的情感连接。"
+}
+
+# 提示词中的心情状态修饰
+MOOD_PROMPT_TEXTS = {
+    CharacterMood.GREAT: "你今天心情特别好，更加活泼和积极。",
+    CharacterMood.GOOD: "你心情不错，比平时稍微开朗一些。",
+    CharacterMood.NEUTRAL: "",  # 不添加修饰
+    CharacterMood.BAD: "你心情有些不好，可能稍微冷淡或沉默一些。",
+    CharacterMood.TERRIBLE: "你心情很糟糕，表现得更加内向或易怒。"
+}
+
+
+@dataclass(slots=True)
 class CharacterState:
     """角色状态数据结构"""
     character_id: str
@@ -46,18 +102,25 @@ class CharacterState:
     negative_interactions: int
     trust_level: float  # 0-100 信任度
     topic_preferences: Dict[str, float]  # 话题偏好分数
-    special_memories: List[str]  # 特殊记忆
+    special_memories: Deque[str]  # 特殊记忆（自动淘汰最旧的）
     created_at: datetime
     updated_at: datetime
+    positive_ratio: float = 0.0  # 正面互动占比（%），随互动增量更新
+    version: int = 0  # 状态版本号，每次交互更新后递增
+    modifiers_cache: Optional[Tuple[int, str]] = None  # (版本号, 提示词状态修饰符)
 
 
 class CharacterStateManager:
     """角色状态管理器"""
     
-    def __init__(self):
+    def __init__(self, max_states: int = MAX_CHARACTER_STATES):
         self.logger = logging.getLogger(__name__)
-        # 存储各会话的角色状态
-        self._character_states: Dict[str, CharacterState] = {}
+        # 存储各会话的角色状态，超过容量时淘汰最久未访问的会话
+        self.max_states = max_states
+        self._character_states: "OrderedDict[Tuple[str, str], CharacterState]" = OrderedDict()  # (character_id, session_id) -> 状态
+        
+        # 角色ID -> (配置数据, 基础活力值)，配置对象变化（重新加载）时重建
+        self._base_energy_cache: Dict[str, Tuple[Any, float]] = {}
         
         # 关系发展阈值
         self.relationship_thresholds = {
@@ -66,6 +129,10 @@ class CharacterStateManager:
             RelationshipLevel.CLOSE_FRIEND: 80,  # 80次互动成为密友
             RelationshipLevel.SPECIAL: 150      # 150次互动达到特殊关系
         }
+        # 按阈值升序排列，供二分查找使用
+        ordered_thresholds = sorted(self.relationship_thresholds.items(), key=lambda item: item[1])
+        self._sorted_thresholds = [threshold for _, threshold in ordered_thresholds]
+        self._sorted_levels = [RelationshipLevel.STRANGER] + [level for level, _ in ordered_thresholds]
         
         # 话题分类词典
         self.topic_keywords = {
@@ -75,33 +142,53 @@ class CharacterStateManager:
             "私人": ["家人", "朋友", "秘密", "梦想", "过去", "未来"],
             "角色相关": ["EVA", "驾驶", "司令", "真嵌", "歌曲", "表演"]
         }
+        
+        # 预编译话题关键词匹配（消息会先转小写，关键词也需统一为小写）
+        self._topic_keywords_lower = {
+            topic: tuple(map(str.lower, keywords)) for topic, keywords in self.topic_keywords.items()
+        }
+        self._keyword_topics: Dict[str, List[str]] = {}
+        for topic, keywords in self._topic_keywords_lower.items():
+            for keyword in keywords:
+                self._keyword_topics.setdefault(keyword, []).append(topic)
+        self._topic_pattern, self._implied_keywords = compile_keyword_pattern(self._keyword_topics)
+        # 关键词首字集合，用于快速排除不含任何关键词的消息
+        self._keyword_first_chars = frozenset(keyword[0] for keyword in self._keyword_topics)
     
     def get_character_state(self, character_id: str, session_id: str) -> CharacterState:
         """获取角色状态"""
-        state_key = f"{character_id}_{session_id}"
-        
-        if state_key not in self._character_states:
-            # 创建新的角色状态
-            now = datetime.now()
-            self._character_states[state_key] = CharacterState(
-                character_id=character_id,
-                session_id=session_id,
-                relationship_level=RelationshipLevel.STRANGER,
-                familiarity_score=0.0,
-                mood=CharacterMood.NEUTRAL,
-                energy_level=75.0,  # 初始活力值
-                last_interaction=now,
-                interaction_count=0,
-                positive_interactions=0,
-                negative_interactions=0,
-                trust_level=50.0,   # 初始信任度
-                topic_preferences={},
-                special_memories=[],
-                created_at=now,
-                updated_at=now
-            )
-        
-        return self._character_states[state_key]
+        state_key = (character_id, session_id)
+        
+        state = self._character_states.get(state_key)
+        if state is not None:
+            self._character_states.move_to_end(state_key)
+            return state
+        
+        # 创建新的角色状态
+        now = datetime.now()
+        state = CharacterState(
+            character_id=character_id,
+            session_id=session_id,
+            relationship_level=RelationshipLevel.STRANGER,
+            familiarity_score=0.0,
+            mood=CharacterMood.NEUTRAL,
+            energy_level=75.0,  # 初始活力值
+            last_interaction=now,
+            interaction_count=0,
+            positive_interactions=0,
+            negative_interactions=0,
+            trust_level=50.0,   # 初始信任度
+            topic_preferences={},
+            special_memories=deque(maxlen=MAX_SPECIAL_MEMORIES),
+            created_at=now,
+            updated_at=now
+        )
+        self._character_states[state_key] = state
+        while len(self._character_states) > self.max_states:
+            evicted_key, _ = self._character_states.popitem(last=False)
+            self.logger.debug(f"角色状态已淘汰: {evicted_key}")
+        
+        return state
     
     def update_state_after_interaction(
         self, 
@@ -127,9 +214,10 @@ class CharacterStateManager:
         state = self.get_character_state(character.id, session_id)
         
         # 更新基础计数
+        now = datetime.now()
         state.interaction_count += 1
-        state.last_interaction = datetime.now()
-        state.updated_at = datetime.now()
+        state.last_interaction = now
+        state.updated_at = now
         
         # 根据交互质量更新正负面计数
         if interaction_quality > 0.6:
@@ -142,6 +230,7 @@ class CharacterStateManager:
             # 降低心情和信任度
             state.mood = self._worsen_mood(state.mood)
             state.trust_level = max(0.0, state.trust_level - 1.0)
+        state.positive_ratio = state.positive_interactions / state.interaction_count * 100
         
         # 更新熟悉度分数
         familiarity_gain = interaction_quality * 2.0
@@ -151,72 +240,49 @@ class CharacterStateManager:
         state.relationship_level = self._calculate_relationship_level(state)
         
         # 分析和更新话题偏好
-        self._update_topic_preferences(state, user_message)
+        user_message_lower = user_message.lower()
+        self._update_topic_preferences(state, user_message_lower)
         
         # 检查是否有特殊记忆值得保存
-        self._check_special_memory(state, user_message, character_response)
+        self._check_special_memory(state, user_message, user_message_lower, character_response)
         
         # 更新活力值（随时间和交互变化）
-        self._update_energy_level(state, character)
+        self._update_energy_level(state, character, now)
         
+        state.version += 1
         return state
     
     def _improve_mood(self, current_mood: CharacterMood) -> CharacterMood:
         """改善心情"""
-        mood_levels = [
-            CharacterMood.TERRIBLE,
-            CharacterMood.BAD,
-            CharacterMood.NEUTRAL,
-            CharacterMood.GOOD,
-            CharacterMood.GREAT
-        ]
-        
-        current_index = mood_levels.index(current_mood)
-        if current_index < len(mood_levels) - 1:
-            return mood_levels[current_index + 1]
-        return current_mood
+        return MOOD_ORDER[min(MAX_MOOD_RANK, MOOD_RANK[current_mood] + 1)]
     
     def _worsen_mood(self, current_mood: CharacterMood) -> CharacterMood:
         """恶化心情"""
-        mood_levels = [
-            CharacterMood.TERRIBLE,
-            CharacterMood.BAD,
-            CharacterMood.NEUTRAL,
-            CharacterMood.GOOD,
-            CharacterMood.GREAT
-        ]
-        
-        current_index = mood_levels.index(current_mood)
-        if current_index > 0:
-            return mood_levels[current_index - 1]
-        return current_mood
+        return MOOD_ORDER[max(0, MOOD_RANK[current_mood] - 1)]
     
     def _calculate_relationship_level(self, state: CharacterState) -> RelationshipLevel:
         """计算关系级别"""
         score = state.familiarity_score + (state.positive_interactions * 2) - state.negative_interactions
-        
-        if score >= self.relationship_thresholds[RelationshipLevel.SPECIAL]:
-            return RelationshipLevel.SPECIAL
-        elif score >= self.relationship_thresholds[RelationshipLevel.CLOSE_FRIEND]:
-            return RelationshipLevel.CLOSE_FRIEND
-        elif score >= self.relationship_thresholds[RelationshipLevel.FRIEND]:
-            return RelationshipLevel.FRIEND
-        elif score >= self.relationship_thresholds[RelationshipLevel.ACQUAINTANCE]:
-            return RelationshipLevel.ACQUAINTANCE
-        else:
-            return RelationshipLevel.STRANGER
+        return self._sorted_levels[bisect_right(self._sorted_thresholds, score)]
     
-    def _update_topic_preferences(self, state: CharacterState, user_message: str):
-        """更新话题偏好"""
-        message_lower = user_message.lower()
-        
-        for topic, keywords in self.topic_keywords.items():
-            score_change = 0
-            for keyword in keywords:
-                if keyword in message_lower:
-                    score_change += 0.5
-            
-            if score_change > 0:
+    def _update_topic_preferences(self, state: CharacterState, message_lower: str):
+        """更新话题偏好（message_lower 为已转小写的用户消息）"""
+        # 消息中没有任何关键词首字时不可能命中，直接跳过正则扫描
+        if self._keyword_first_chars.isdisjoint(message_lower):
+            return
+        
+        matched = match_keywords(self._topic_pattern, self._implied_keywords, message_lower)
+        if not matched:
+            return
+        
+        score_changes: Dict[str, float] = {}
+        for keyword in matched:
+            for topic in self._keyword_topics[keyword]:
+                score_changes[topic] = score_changes.get(topic, 0) + 0.5
+        
+        for topic in self.topic_keywords:
+            score_change = score_changes.get(topic)
+            if score_change:
                 current_score = state.topic_preferences.get(topic, 0.0)
                 state.topic_preferences[topic] = min(10.0, current_score + score_change)
     
@@ -224,47 +290,44 @@ class CharacterStateManager:
         self, 
         state: CharacterState, 
         user_message: str, 
+        message_lower: str,
         character_response: str
     ):
         """检查是否有特殊记忆需要保存"""
-        special_indicators = [
-            "我喜欢你", "我爱你", "生日", "重要", "秘密", 
-            "第一次", "特别", "难忘", "永远", "承诺"
-        ]
-        
-        for indicator in special_indicators:
-            if indicator in user_message.lower():
-                memory = f"用户说: {user_message[:50]}..."
-                if memory not in state.special_memories:
-                    state.special_memories.append(memory)
-                    # 保持最多10个特殊记忆
-                    if len(state.special_memories) > 10:
-                        state.special_memories.pop(0)
-                break
+        if SPECIAL_INDICATOR_FIRST_CHARS.isdisjoint(message_lower):
+            return
+        
+        if SPECIAL_INDICATOR_PATTERN.search(message_lower):
+            memory = f"用户说: {user_message[:50]}..."
+            if memory not in state.special_memories:
+                # deque 已设置 maxlen，超出时自动丢弃最旧的记忆
+                state.special_memories.append(memory)
     
-    def _update_energy_level(self, state: CharacterState, character: Character):
-        """更新活力值"""
-        config_data = getattr(character, '_config_data', {})
+    def _get_base_energy(self, character: Character) -> float:
+        """获取角色的基础活力值（按角色缓存，角色配置重新加载后自动重建）"""
+        config_data = getattr(character, '_config_data', EMPTY_CONFIG)
+        cached = self._base_energy_cache.get(character.id)
+        if cached is not None and cached[0] is config_data:
+            return cached[1]
+        
         personality_deep = config_data.get('personality_deep', {})
         
         # 根据角色特性调整活力变化
         base_energy = personality_deep.get('big_five_personality', {}).get('extraversion', 5) * 10
+        self._base_energy_cache[character.id] = (config_data, base_energy)
+        return base_energy
+    
+    def _update_energy_level(self, state: CharacterState, character: Character, now: datetime):
+        """更新活力值"""
+        base_energy = self._get_base_energy(character)
         
         # 时间衰减
-        time_since_last = datetime.now() - state.last_interaction
+        time_since_last = now - state.last_interaction
         if time_since_last.total_seconds() > 3600:  # 超过1小时
             state.energy_level = max(30.0, state.energy_level - 5.0)
         
         # 根据心情调整
-        mood_modifiers = {
-            CharacterMood.GREAT: 10,
-            CharacterMood.GOOD: 5,
-            CharacterMood.NEUTRAL: 0,
-            CharacterMood.BAD: -5,
-            CharacterMood.TERRIBLE: -10
-        }
-        
-        target_energy = base_energy + mood_modifiers.get(state.mood, 0)
+        target_energy = base_energy + MOOD_ENERGY_MODIFIERS[MOOD_RANK[state.mood]]
         
         # 渐进调整到目标值
         if state.energy_level < target_energy:
@@ -289,31 +352,22 @@ class CharacterStateManager:
         """
         state = self.get_character_state(character.id, session_id)
         
+        # 状态未变化时直接返回上次生成的结果
+        cached = state.modifiers_cache
+        if cached is not None and cached[0] == state.version:
+            return cached[1]
+        
         modifiers = []
         
         # 关系状态修饰
-        relationship_texts = {
-            RelationshipLevel.STRANGER: "这是你们的初次相遇，保持适当的距离和礼貌。",
-            RelationshipLevel.ACQUAINTANCE: "你们已经认识了，可以稍微亲近一些。",
-            RelationshipLevel.FRIEND: "你们已经是朋友了，可以更加自在和亲密。",
-            RelationshipLevel.CLOSE_FRIEND: "你们是很好的朋友，可以分享更多私人想法。",
-            RelationshipLevel.SPECIAL: "你们有着特殊的关系，可以表现出更深层的情感连接。"
-        }
-        
-        if state.relationship_level in relationship_texts:
-            modifiers.append(relationship_texts[state.relationship_level])
+        relationship_text = RELATIONSHIP_PROMPT_TEXTS.get(state.relationship_level)
+        if relationship_text:
+            modifiers.append(relationship_text)
         
         # 心情状态修饰
-        mood_texts = {
-            CharacterMood.GREAT: "你今天心情特别好，更加活泼和积极。",
-            CharacterMood.GOOD: "你心情不错，比平时稍微开朗一些。",
-            CharacterMood.NEUTRAL: "",  # 不添加修饰
-            CharacterMood.BAD: "你心情有些不好，可能稍微冷淡或沉默一些。",
-            CharacterMood.TERRIBLE: "你心情很糟糕，表现得更加内向或易怒。"
-        }
-        
-        if state.mood in mood_texts and mood_texts[state.mood]:
-            modifiers.append(mood_texts[state.mood])
+        mood_text = MOOD_PROMPT_TEXTS.get(state.mood)
+        if mood_text:
+            modifiers.append(mood_text)
         
         # 活力值修饰
         if state.energy_level > 80:
@@ -328,12 +382,14 @@ class CharacterStateManager:
         
         # 特殊记忆提示
         if state.special_memories:
-            modifiers.append(f"记住这些重要的对话：{'; '.join(state.special_memories[-2:])}")
+            modifiers.append(f"记住这些重要的对话：{'; '.join(list(state.special_memories)[-2:])}")
         
+        result = ""
         if modifiers:
-            return f"\n\n<character_state>\n{chr(10).join(modifiers)}\n</character_state>"
+            result = "\n\n<character_state>\n" + "\n".join(modifiers) + "\n</character_state>"
         
-        return ""
+        state.modifiers_cache = (state.version, result)
+        return result
     
     def get_interaction_suggestions(
         self, 
@@ -369,9 +425,7 @@ class CharacterStateManager:
     
     def reset_session_state(self, character_id: str, session_id: str):
         """重置会话状态"""
-        state_key = f"{character_id}_{session_id}"
-        if state_key in self._character_states:
-            del self._character_states[state_key]
+        self._character_states.pop((character_id, session_id), None)
     
     def get_state_summary(self, character_id: str, session_id: str) -> Dict[str, Any]:
         """获取状态摘要"""
@@ -384,10 +438,8 @@ class CharacterStateManager:
             "energy_level": state.energy_level,
             "trust_level": state.trust_level,
             "interaction_count": state.interaction_count,
-            "positive_ratio": (
-                state.positive_interactions / max(1, state.interaction_count) * 100
-            ),
-            "preferred_topics": list(state.topic_preferences.keys())[:3],
+            "positive_ratio": state.positive_ratio,
+            "preferred_topics": list(islice(state.topic_preferences, 3)),
             "special_memories_count": len(state.special_memories),
             "days_since_creation": (datetime.now() - state.created_at).days
         } 
\ No newline at end of file
@@ -5,8 +5,12 @@
 """
 
 import logging
+from collections import OrderedDict
 from typing import Dict, List, Optional, Any, Tuple
-from datetime import datetime
+from dataclasses import dataclass, field
+from enum import IntEnum
+from itertools import islice
+from types import MappingProxyType
 import re
 
 from app.models import Character
@@ -14,24 +18,131 @@ from app.services.emotion_manager import EmotionManager, EmotionalState
 from app.services.character_state_manager import CharacterStateManager, CharacterMood
 from app.services.memory_manager import MemoryManager
 from app.services.character_relationship_manager import CharacterRelationshipManager
+from app.services.keyword_matching import compile_keywords
 
 
-class ContextType(Enum):
-    """上下文类型枚举"""
-    EMOTIONAL = "emotional"       # 情感上下文
-    TEMPORAL = "temporal"         # 时间上下文
-    RELATIONAL = "relational"     # 关系上下文
-    TOPICAL = "topical"          # 话题上下文
-    BEHAVIORAL = "behavioral"     # 行为上下文
+# 上下文分析结果缓存的最大条目数
+ANALYSIS_CACHE_SIZE = 128
 
+# 触发语调调整的情感强度阈值
+HIGH_EMOTION_INTENSITY = 0.7
 
-class AdjustmentType(Enum):
-    """调整类型枚举"""
-    TONE = "tone"                # 语调调整
-    FORMALITY = "formality"      # 正式程度调整
-    ENTHUSIASM = "enthusiasm"    # 热情度调整
-    INTIMACY = "intimacy"        # 亲密度调整
-    DIRECTNESS = "directness"    # 直接程度调整
+# 角色名称 -> 角色ID
+CHARACTER_NAMES = {
+    "绫波零": "rei_ayanami",
+    "明日香": "asuka_langley",
+    "初音未来": "miku_hatsune",
+    "零": "rei_ayanami",
+    "未来": "miku_hatsune"
+}
+
+# 话题关键词 -> 话题（按优先级排列，靠前的优先）
+TOPIC_KEYWORDS = {
+    "学习": "education",
+    "工作": "work",
+    "音乐": "music",
+    "电影": "entertainment",
+    "爱好": "hobbies",
+    "感情": "relationships",
+    "家人": "family",
+    "EVA": "eva",
+    "驾驶": "eva",
+    "歌曲": "music"
+}
+TOPIC_PRIORITY = {keyword: index for index, keyword in enumerate(TOPIC_KEYWORDS)}
+
+# 时间敏感关键词
+TIME_KEYWORDS = ("现在", "立刻", "马上", "快", "急", "等不及")
+
+# 用户用语正式程度指示词
+FORMAL_INDICATORS = ("您", "请", "谢谢", "不好意思")
+CASUAL_INDICATORS = ("哈哈", "嗯", "哦", "吧")
+
+# 情感强度指示符 -> 权重
+INTENSITY_INDICATORS = {
+    "!": 0.2, "！": 0.2,
+    "?": 0.1, "？": 0.1,
+    "...": 0.15, "。。。": 0.15,
+    "啊": 0.1, "呀": 0.1, "哦": 0.1
+}
+
+CHARACTER_NAME_PATTERN = compile_keywords(tuple(CHARACTER_NAMES))
+TOPIC_PATTERN = compile_keywords(tuple(TOPIC_KEYWORDS), overlapping=True)
+TIME_KEYWORD_PATTERN = compile_keywords(TIME_KEYWORDS)
+INTENSITY_PATTERN = compile_keywords(tuple(INTENSITY_INDICATORS))
+
+
+class ContextType(IntEnum):
+    """上下文类型枚举（连续整数值，哈希与比较均为整数运算）"""
+    EMOTIONAL = 0       # 情感上下文
+    TEMPORAL = 1        # 时间上下文
+    RELATIONAL = 2      # 关系上下文
+    TOPICAL = 3         # 话题上下文
+    BEHAVIORAL = 4      # 行为上下文
+
+
+class AdjustmentType(IntEnum):
+    """调整类型枚举（连续整数值，哈希与比较均为整数运算）"""
+    TONE = 0            # 语调调整
+    FORMALITY = 1       # 正式程度调整
+    ENTHUSIASM = 2      # 热情度调整
+    INTIMACY = 3        # 亲密度调整
+    DIRECTNESS = 4      # 直接程度调整
+
+
+@dataclass(slots=True)
+class HistoryStats:
+    """对话历史的预计算统计（单次遍历得到，供各分析器共享）"""
+    total_count: int = 0                # 消息总数
+    user_count: int = 0                 # 用户消息数
+    user_total_length: int = 0          # 用户消息总长度
+    formal_count: int = 0               # 正式用语命中次数
+    casual_count: int = 0               # 随意用语命中次数
+    question_count: int = 0             # 含问号的用户消息数
+    assistant_contents: List[str] = field(default_factory=list)  # 角色消息内容
+    recent_contents: List[str] = field(default_factory=list)     # 最近5条消息内容
+
+
+@dataclass(frozen=True, slots=True)
+class CharacterPolicies:
+    """角色行为约束（从角色配置解析后按角色缓存）"""
+    forbidden_topic_pattern: Optional[re.Pattern]  # 禁止话题正则，没有禁止话题时为None
+    forbidden_words: Tuple[str, ...]               # 禁用词汇
+    forbidden_word_pattern: Optional[re.Pattern]   # 禁用词汇正则，没有禁用词汇时为None
+    preferred_expressions: Tuple[str, ...]         # 偏好表达
+
+
+# 没有配置数据的角色共用的空配置（固定对象，使按配置对象缓存的结果可以命中）
+EMPTY_CONFIG = MappingProxyType({})
+
+# 没有对话历史时的时间/行为上下文（只读，所有分析结果共享）
+EMPTY_HISTORY_TEMPORAL_CONTEXT = MappingProxyType({
+    "session_duration": 0.0,
+    "response_pace": "slow",
+    "time_sensitive": False,
+    "conversation_length": 0
+})
+EMPTY_HISTORY_BEHAVIORAL_CONTEXT = MappingProxyType({
+    "user_patterns": MappingProxyType({}),
+    "consistency_score": 1.0,
+    "interaction_quality": 0.5
+})
+
+
+# 调整指令模板：(调整类型, 情感或方向) -> 指令格式
+ADJUSTMENT_TEMPLATES = {
+    (AdjustmentType.TONE, EmotionalState.PLEASED): "语调调整：表现得更加愉悦和积极(强度: {level:.1f})",
+    (AdjustmentType.TONE, EmotionalState.SAD): "语调调整：表现得更加同情和温柔(强度: {level:.1f})",
+    (AdjustmentType.TONE, EmotionalState.ANGRY): "语调调整：控制情绪，保持角色特有的表达方式(强度: {level:.1f})",
+    (AdjustmentType.FORMALITY, "increase"): "正式度调整：使用更正式和礼貌的表达(程度: {level:.1f})",
+    (AdjustmentType.FORMALITY, "decrease"): "正式度调整：使用更轻松和随意的表达(程度: {level:.1f})",
+    (AdjustmentType.INTIMACY, "increase"): "亲密度调整：表现得更加亲近和关怀(程度: {level:.1f})",
+    (AdjustmentType.INTIMACY, "decrease"): "亲密度调整：保持适当的距离感(程度: {level:.1f})",
+    (AdjustmentType.ENTHUSIASM, "increase"): "热情度调整：表现得更加积极和兴奋(程度: {level:.1f})",
+    (AdjustmentType.ENTHUSIASM, "decrease"): "热情度调整：保持冷静和克制(程度: {level:.1f})",
+    (AdjustmentType.DIRECTNESS, "increase"): "直接度调整：更加直白和明确地表达(程度: {level:.1f})",
+    (AdjustmentType.DIRECTNESS, "decrease"): "直接度调整：使用更加委婉和含蓄的表达(程度: {level:.1f})"
+}
 
 
 class ContextAwareAdjuster:
@@ -82,6 +193,56 @@ class ContextAwareAdjuster:
                 AdjustmentType.INTIMACY: "保持适当距离"
             }
         }
+        
+        # 角色ID -> (配置数据, 行为约束)，配置对象变化（重新加载）时重建
+        self._policy_cache: Dict[str, Tuple[Any, CharacterPolicies]] = {}
+        
+        # 上下文分析缓存：同一轮对话重复分析时直接复用，条目为 [分析结果, 调整指令]
+        self._analysis_cache: "OrderedDict[Tuple, List[Any]]" = OrderedDict()
+    
+    def _get_analysis_entry(
+        self,
+        character: Character,
+        session_id: str,
+        user_message: str,
+        conversation_history: List[Dict[str, str]]
+    ) -> List[Any]:
+        """
+        获取上下文分析缓存条目，未命中时执行完整分析
+        
+        缓存键包含角色状态版本、关系数据版本、角色行为约束和最近的情感历史，
+        任一变化（包括角色配置重新加载）后自动失效。
+        
+        Returns:
+            List[Any]: [分析结果, 调整指令（尚未生成时为None）]
+        """
+        emotion_history = self.emotion_manager.get_emotion_history(character.id, session_id)
+        char_state = self.state_manager.get_character_state(character.id, session_id)
+        cache_key = (
+            character.id,
+            session_id,
+            user_message,
+            len(conversation_history),
+            conversation_history[-1].get("content", "") if conversation_history else None,
+            char_state.version,
+            self.relationship_manager.version,
+            self._character_policies(character),
+            tuple(emotion_history[-3:])
+        )
+        
+        entry = self._analysis_cache.get(cache_key)
+        if entry is not None:
+            self._analysis_cache.move_to_end(cache_key)
+            return entry
+        
+        context_analysis = self._analyze_context(
+            character, session_id, user_message, conversation_history, emotion_history
+        )
+        entry = [context_analysis, None]
+        self._analysis_cache[cache_key] = entry
+        if len(self._analysis_cache) > ANALYSIS_CACHE_SIZE:
+            self._analysis_cache.popitem(last=False)
+        return entry
     
     def analyze_context(
         self,
@@ -102,18 +263,35 @@ class ContextAwareAdjuster:
         Returns:
             Dict: 上下文分析结果
         """
+        return self._get_analysis_entry(
+            character, session_id, user_message, conversation_history
+        )[0]
+    
+    def _analyze_context(
+        self,
+        character: Character,
+        session_id: str,
+        user_message: str,
+        conversation_history: List[Dict[str, str]],
+        emotion_history: List[EmotionalState]
+    ) -> Dict[str, Any]:
+        """执行多维度上下文分析（不使用缓存）"""
         context_analysis = {}
+        history_stats = self._precompute_history_stats(conversation_history)
         
         # 情感上下文分析
         emotional_context = self._analyze_emotional_context(
-            character, session_id, user_message
+            character, session_id, user_message, emotion_history
         )
         context_analysis[ContextType.EMOTIONAL] = emotional_context
         
-        # 时间上下文分析
-        temporal_context = self._analyze_temporal_context(
-            character, session_id, conversation_history
-        )
+        # 时间上下文分析（没有对话历史时结果固定）
+        if history_stats.total_count:
+            temporal_context = self._analyze_temporal_context(
+                character, session_id, history_stats
+            )
+        else:
+            temporal_context = EMPTY_HISTORY_TEMPORAL_CONTEXT
         context_analysis[ContextType.TEMPORAL] = temporal_context
         
         # 关系上下文分析
@@ -124,30 +302,62 @@ class ContextAwareAdjuster:
         
         # 话题上下文分析
         topical_context = self._analyze_topical_context(
-            character, session_id, user_message, conversation_history
+            character, session_id, user_message, history_stats
         )
         context_analysis[ContextType.TOPICAL] = topical_context
         
-        # 行为上下文分析
-        behavioral_context = self._analyze_behavioral_context(
-            character, session_id, conversation_history
-        )
+        # 行为上下文分析（没有对话历史时结果固定）
+        if history_stats.total_count:
+            behavioral_context = self._analyze_behavioral_context(
+                character, session_id, history_stats
+            )
+        else:
+            behavioral_context = EMPTY_HISTORY_BEHAVIORAL_CONTEXT
         context_analysis[ContextType.BEHAVIORAL] = behavioral_context
         
         return context_analysis
     
+    def _precompute_history_stats(self, conversation_history: List[Dict[str, str]]) -> HistoryStats:
+        """单次遍历对话历史，计算各分析器共用的统计量"""
+        stats = HistoryStats(
+            total_count=len(conversation_history),
+            recent_contents=[msg.get("content", "") for msg in conversation_history[-5:]]
+        )
+        for msg in conversation_history:
+            role = msg.get("role")
+            if role == "assistant":
+                stats.assistant_contents.append(msg.get("content", ""))
+                continue
+            if role != "user":
+                continue
+            
+            content = msg.get("content", "")
+            stats.user_count += 1
+            stats.user_total_length += len(content)
+            
+            # 正式程度指示词
+            for indicator in FORMAL_INDICATORS:
+                if indicator in content:
+                    stats.formal_count += 1
+            for indicator in CASUAL_INDICATORS:
+                if indicator in content:
+                    stats.casual_count += 1
+            
+            if "?" in content or "？" in content:
+                stats.question_count += 1
+        
+        return stats
+    
     def _analyze_emotional_context(
         self, 
         character: Character, 
         session_id: str, 
-        user_message: str
+        user_message: str,
+        emotion_history: List[EmotionalState]
     ) -> Dict[str, Any]:
         """分析情感上下文"""
         # 获取当前情感状态
         current_emotion = self.emotion_manager.analyze_emotion(user_message)
-        emotion_history = self.emotion_manager.get_emotion_history(
-            character.id, session_id
-        )
         
         # 计算情感强度
         emotion_intensity = self._calculate_emotion_intensity(user_message)
@@ -159,32 +369,30 @@ class ContextAwareAdjuster:
             "current_emotion": current_emotion,
             "emotion_intensity": emotion_intensity,
             "emotion_trend": emotion_trend,
-            "emotion_stability": len(set(emotion_history[-3:])) <= 1 if emotion_history else True
+            "emotion_stability": self._is_emotion_stable(emotion_history)
         }
     
     def _analyze_temporal_context(
         self,
         character: Character,
         session_id: str,
-        conversation_history: List[Dict[str, str]]
+        history_stats: HistoryStats
     ) -> Dict[str, Any]:
         """分析时间上下文"""
-        now = datetime.now()
-        
         # 会话持续时间
-        session_duration = self._estimate_session_duration(conversation_history)
+        session_duration = self._estimate_session_duration(history_stats)
         
         # 响应节奏
-        response_pace = self._analyze_response_pace(conversation_history)
+        response_pace = self._analyze_response_pace(history_stats)
         
         # 时间敏感性
-        time_sensitive = self._detect_time_sensitivity(conversation_history)
+        time_sensitive = self._detect_time_sensitivity(history_stats)
         
         return {
             "session_duration": session_duration,
             "response_pace": response_pace,
             "time_sensitive": time_sensitive,
-            "conversation_length": len(conversation_history)
+            "conversation_length": history_stats.total_count
         }
     
     def _analyze_relational_context(
@@ -220,7 +428,7 @@ class ContextAwareAdjuster:
         character: Character,
         session_id: str,
         user_message: str,
-        conversation_history: List[Dict[str, str]]
+        history_stats: HistoryStats
     ) -> Dict[str, Any]:
         """分析话题上下文"""
         # 当前话题
@@ -228,8 +436,7 @@ class ContextAwareAdjuster:
         
         # 话题历史
         topic_history = [
-            self._extract_topic(msg.get("content", ""))
-            for msg in conversation_history[-5:]
+            self._extract_topic(content) for content in history_stats.recent_contents
         ]
         
         # 话题转换
@@ -249,21 +456,21 @@ class ContextAwareAdjuster:
         self,
         character: Character,
         session_id: str,
-        conversation_history: List[Dict[str, str]]
+        history_stats: HistoryStats
     ) -> Dict[str, Any]:
         """分析行为上下文"""
         # 用户行为模式
-        user_patterns = self._analyze_user_patterns(conversation_history)
+        user_patterns = self._analyze_user_patterns(history_stats)
         
         # 角色一致性检查
         consistency_score = self._check_character_consistency(
-            character, conversation_history
+            character, history_stats
         )
         
         return {
             "user_patterns": user_patterns,
             "consistency_score": consistency_score,
-            "interaction_quality": self._assess_interaction_quality(conversation_history)
+            "interaction_quality": self._assess_interaction_quality(history_stats)
         }
     
     def generate_adjustment_instructions(
@@ -285,10 +492,18 @@ class ContextAwareAdjuster:
         Returns:
             str: 调整指令文本
         """
-        # 分析上下文
-        context_analysis = self.analyze_context(
-            character, session_id, user_message, conversation_history
-        )
+        entry = None
+        if conversation_history:
+            # 分析上下文（同一轮对话的调整指令直接复用）
+            entry = self._get_analysis_entry(
+                character, session_id, user_message, conversation_history
+            )
+            if entry[1] is not None:
+                return entry[1]
+            context_analysis = entry[0]
+        else:
+            # 没有对话历史时只计算影响调整指令的因素，跳过完整上下文分析
+            context_analysis = self._analyze_minimal_context(character, session_id, user_message)
         
         # 确定需要的调整
         required_adjustments = self._determine_required_adjustments(context_analysis)
@@ -296,24 +511,59 @@ class ContextAwareAdjuster:
         # 生成调整指令
         adjustment_instructions = []
         
-        for adjustment_type, adjustment_details in required_adjustments.items():
+        for adjustment_type, adjustment_details in zip(AdjustmentType, required_adjustments):
+            if adjustment_details is None:
+                continue
             instruction = self._generate_specific_adjustment_instruction(
                 adjustment_type, adjustment_details, character
             )
             if instruction:
                 adjustment_instructions.append(instruction)
         
+        instructions = ""
         if adjustment_instructions:
-            return f"\n\n<response_adjustments>\n{chr(10).join(adjustment_instructions)}\n</response_adjustments>"
+            instructions = "\n\n<response_adjustments>\n" + "\n".join(adjustment_instructions) + "\n</response_adjustments>"
         
-        return ""
+        if entry is not None:
+            entry[1] = instructions
+        return instructions
+    
+    def _analyze_minimal_context(
+        self,
+        character: Character,
+        session_id: str,
+        user_message: str
+    ) -> Dict[ContextType, Dict[str, Any]]:
+        """
+        仅计算确定调整指令所需的上下文（无对话历史时使用）
+        
+        提及角色、话题历史、时间和行为上下文不影响调整指令，
+        当前情感也只在情感强度足够高时才需要分析。
+        """
+        emotion_intensity = self._calculate_emotion_intensity(user_message)
+        emotional_context = {"emotion_intensity": emotion_intensity}
+        if emotion_intensity > HIGH_EMOTION_INTENSITY:
+            emotional_context["current_emotion"] = self.emotion_manager.analyze_emotion(user_message)
+        
+        char_state = self.state_manager.get_character_state(character.id, session_id)
+        
+        return {
+            ContextType.EMOTIONAL: emotional_context,
+            ContextType.RELATIONAL: {"familiarity_score": char_state.familiarity_score},
+            ContextType.TOPICAL: {"sensitive_topic": self._detect_sensitive_topic(user_message, character)}
+        }
     
     def _determine_required_adjustments(
         self, 
         context_analysis: Dict[str, Any]
-    ) -> Dict[AdjustmentType, Dict[str, Any]]:
-        """确定需要的调整"""
-        required_adjustments = {}
+    ) -> List[Optional[Dict[str, Any]]]:
+        """
+        确定需要的调整
+        
+        Returns:
+            List[Optional[Dict[str, Any]]]: 按 AdjustmentType 值索引的调整详情，None 表示不调整
+        """
+        required_adjustments: List[Optional[Dict[str, Any]]] = [None] * len(AdjustmentType)
         
         emotional_ctx = context_analysis.get(ContextType.EMOTIONAL, {})
         relational_ctx = context_analysis.get(ContextType.RELATIONAL, {})
@@ -321,7 +571,7 @@ class ContextAwareAdjuster:
         behavioral_ctx = context_analysis.get(ContextType.BEHAVIORAL, {})
         
         # 基于情感状态的调整
-        if emotional_ctx.get("emotion_intensity", 0) > 0.7:
+        if emotional_ctx.get("emotion_intensity", 0) > HIGH_EMOTION_INTENSITY:
             required_adjustments[AdjustmentType.TONE] = {
                 "direction": "emotional",
                 "intensity": emotional_ctx.get("emotion_intensity", 0.5),
@@ -369,86 +619,75 @@ class ContextAwareAdjuster:
         character: Character
     ) -> str:
         """生成具体的调整指令"""
-        direction = adjustment_details.get("direction", "neutral")
-        level = adjustment_details.get("intensity", adjustment_details.get("level", 0.5))
-        
         if adjustment_type == AdjustmentType.TONE:
-            emotion = adjustment_details.get("emotion", EmotionalState.NEUTRAL)
-            if emotion == EmotionalState.PLEASED:
-                return f"语调调整：表现得更加愉悦和积极(强度: {level:.1f})"
-            elif emotion == EmotionalState.SAD:
-                return f"语调调整：表现得更加同情和温柔(强度: {level:.1f})"
-            elif emotion == EmotionalState.ANGRY:
-                return f"语调调整：控制情绪，保持角色特有的表达方式(强度: {level:.1f})"
-        
-        elif adjustment_type == AdjustmentType.FORMALITY:
-            if direction == "increase":
-                return f"正式度调整：使用更正式和礼貌的表达(程度: {level:.1f})"
-            elif direction == "decrease":
-                return f"正式度调整：使用更轻松和随意的表达(程度: {level:.1f})"
-        
-        elif adjustment_type == AdjustmentType.INTIMACY:
-            if direction == "increase":
-                return f"亲密度调整：表现得更加亲近和关怀(程度: {level:.1f})"
-            elif direction == "decrease":
-                return f"亲密度调整：保持适当的距离感(程度: {level:.1f})"
-        
-        elif adjustment_type == AdjustmentType.ENTHUSIASM:
-            if direction == "increase":
-                return f"热情度调整：表现得更加积极和兴奋(程度: {level:.1f})"
-            elif direction == "decrease":
-                return f"热情度调整：保持冷静和克制(程度: {level:.1f})"
-        
-        elif adjustment_type == AdjustmentType.DIRECTNESS:
-            if direction == "increase":
-                return f"直接度调整：更加直白和明确地表达(程度: {level:.1f})"
-            elif direction == "decrease":
-                return f"直接度调整：使用更加委婉和含蓄的表达(程度: {level:.1f})"
-        
-        return ""
+            variant = adjustment_details.get("emotion", EmotionalState.NEUTRAL)
+        else:
+            variant = adjustment_details.get("direction", "neutral")
+        
+        template = ADJUSTMENT_TEMPLATES.get((adjustment_type, variant))
+        if template is None:
+            return ""
+        
+        level = adjustment_details.get("intensity", adjustment_details.get("level", 0.5))
+        return template.format(level=level)
     
     def _calculate_emotion_intensity(self, message: str) -> float:
         """计算情感强度"""
-        # 简单的情感强度计算
-        intensity_indicators = {
-            "!": 0.2, "！": 0.2,
-            "?": 0.1, "？": 0.1,
-            "...": 0.15, "。。。": 0.15,
-            "啊": 0.1, "呀": 0.1, "哦": 0.1
-        }
+        # 简单的情感强度计算：一次扫描统计所有指示符出现次数
+        counts: Dict[str, int] = {}
+        for indicator in INTENSITY_PATTERN.findall(message):
+            counts[indicator] = counts.get(indicator, 0) + 1
         
         intensity = 0.0
-        for indicator, value in intensity_indicators.items():
-            count = message.count(indicator)
-            intensity += count * value
+        if counts:
+            # 按指示符表顺序累加，保持与逐项计数相同的结果
+            for indicator, value in INTENSITY_INDICATORS.items():
+                intensity += counts.get(indicator, 0) * value
         
-        # 检查大写字母比例（如果有）
-        if any(c.isupper() for c in message):
+        # 检查是否含有大写字母：lower() 在C层完成一次扫描，比逐字符调用 isupper() 快
+        if message.lower() != message:
             intensity += 0.1
         
         return min(1.0, intensity)
     
     def _analyze_emotion_trend(self, emotion_history: List[EmotionalState]) -> str:
         """分析情感趋势"""
-        if len(emotion_history) < 2:
+        history_length = len(emotion_history)
+        if history_length < 2:
             return "stable"
         
-        recent_emotions = emotion_history[-3:]
-        if len(set(recent_emotions)) == 1:
+        # 直接比较最近（至多）3个情感，避免构建切片和集合
+        previous, latest = emotion_history[-2], emotion_history[-1]
+        if history_length == 2:
+            return "stable" if previous == latest else "volatile"
+        
+        earliest = emotion_history[-3]
+        if earliest == previous == latest:
             return "stable"
-        elif len(set(recent_emotions)) == len(recent_emotions):
+        elif earliest != previous and previous != latest and earliest != latest:
             return "volatile"
         else:
             return "changing"
     
-    def _estimate_session_duration(self, conversation_history: List[Dict[str, str]]) -> float:
+    def _is_emotion_stable(self, emotion_history: List[EmotionalState]) -> bool:
+        """最近（至多）3个情感是否完全相同"""
+        history_length = len(emotion_history)
+        if history_length < 2:
+            return True
+        
+        latest = emotion_history[-1]
+        if emotion_history[-2] != latest:
+            return False
+        return history_length == 2 or emotion_history[-3] == latest
+    
+    def _estimate_session_duration(self, history_stats: HistoryStats) -> float:
         """估算会话持续时间（小时）"""
         # 简化计算：假设每轮对话2分钟
-        return len(conversation_history) * 2 / 60
+        return history_stats.total_count * 2 / 60
     
-    def _analyze_response_pace(self, conversation_history: List[Dict[str, str]]) -> str:
+    def _analyze_response_pace(self, history_stats: HistoryStats) -> str:
         """分析响应节奏"""
-        msg_count = len(conversation_history)
+        msg_count = history_stats.total_count
         if msg_count > 20:
             return "fast"
         elif msg_count > 10:
@@ -456,55 +695,31 @@ class ContextAwareAdjuster:
         else:
             return "slow"
     
-    def _detect_time_sensitivity(self, conversation_history: List[Dict[str, str]]) -> bool:
-        """检测时间敏感性"""
-        time_keywords = ["现在", "立刻", "马上", "快", "急", "等不及"]
-        recent_messages = conversation_history[-3:] if conversation_history else []
-        
-        for msg in recent_messages:
-            content = msg.get("content", "").lower()
-            if any(keyword in content for keyword in time_keywords):
+    def _detect_time_sensitivity(self, history_stats: HistoryStats) -> bool:
+        """检测时间敏感性（只看最近3条消息，顺序无关，从最新一条开始检查）"""
+        for content in islice(reversed(history_stats.recent_contents), 3):
+            if TIME_KEYWORD_PATTERN.search(content.lower()):
                 return True
         
         return False
     
     def _extract_mentioned_characters(self, message: str) -> List[str]:
-        """提取提及的角色"""
-        character_names = {
-            "绫波零": "rei_ayanami",
-            "明日香": "asuka_langley", 
-            "初音未来": "miku_hatsune",
-            "零": "rei_ayanami",
-            "未来": "miku_hatsune"
-        }
-        
-        mentioned = []
-        for name, char_id in character_names.items():
-            if name in message:
-                mentioned.append(char_id)
-        
-        return mentioned
+        """提取提及的角色（按 CHARACTER_NAMES 顺序去重）"""
+        matched = set(CHARACTER_NAME_PATTERN.findall(message))
+        if not matched:
+            return []
+        
+        return list(dict.fromkeys(
+            char_id for name, char_id in CHARACTER_NAMES.items() if name in matched
+        ))
     
     def _extract_topic(self, message: str) -> str:
         """提取话题"""
-        topic_keywords = {
-            "学习": "education",
-            "工作": "work", 
-            "音乐": "music",
-            "电影": "entertainment",
-            "爱好": "hobbies",
-            "感情": "relationships",
-            "家人": "family",
-            "EVA": "eva",
-            "驾驶": "eva",
-            "歌曲": "music"
-        }
-        
-        for keyword, topic in topic_keywords.items():
-            if keyword in message:
-                return topic
+        matched = TOPIC_PATTERN.findall(message)
+        if not matched:
+            return "general"
         
-        return "general"
+        return TOPIC_KEYWORDS[min(matched, key=TOPIC_PRIORITY.__getitem__)]
     
     def _detect_topic_shift(self, topic_history: List[str]) -> bool:
         """检测话题转换"""
@@ -515,85 +730,88 @@ class ContextAwareAdjuster:
     
     def _detect_sensitive_topic(self, message: str, character: Character) -> bool:
         """检测敏感话题"""
-        config_data = getattr(character, '_config_data', {})
+        pattern = self._character_policies(character).forbidden_topic_pattern
+        return pattern is not None and pattern.search(message.casefold()) is not None
+    
+    def _character_policies(self, character: Character) -> CharacterPolicies:
+        """获取角色行为约束（按角色缓存，角色配置重新加载后自动重建）"""
+        config_data = getattr(character, '_config_data', EMPTY_CONFIG)
+        cached = self._policy_cache.get(character.id)
+        if cached is not None and cached[0] is config_data:
+            return cached[1]
+        
         behavioral_constraints = config_data.get('behavioral_constraints', {})
         forbidden_topics = behavioral_constraints.get('forbidden_topics', [])
+        forbidden_words = tuple(behavioral_constraints.get('forbidden_words', []))
+        policies = CharacterPolicies(
+            forbidden_topic_pattern=(
+                compile_keywords(tuple(topic.casefold() for topic in forbidden_topics))
+                if forbidden_topics else None
+            ),
+            forbidden_words=forbidden_words,
+            forbidden_word_pattern=compile_keywords(forbidden_words) if forbidden_words else None,
+            preferred_expressions=tuple(behavioral_constraints.get('preferred_expressions', []))
+        )
         
-        message_lower = message.lower()
-        return any(topic.lower() in message_lower for topic in forbidden_topics)
+        self._policy_cache[character.id] = (config_data, policies)
+        return policies
     
-    def _analyze_user_patterns(self, conversation_history: List[Dict[str, str]]) -> Dict[str, Any]:
+    def _analyze_user_patterns(self, history_stats: HistoryStats) -> Dict[str, Any]:
         """分析用户模式"""
-        user_messages = [
-            msg.get("content", "") for msg in conversation_history 
-            if msg.get("role") == "user"
-        ]
-        
-        if not user_messages:
+        if not history_stats.user_count:
             return {}
         
         # 分析正式程度偏好
-        formal_indicators = ["您", "请", "谢谢", "不好意思"]
-        casual_indicators = ["哈哈", "嗯", "哦", "吧"]
-        
-        formal_count = sum(
-            sum(indicator in msg for indicator in formal_indicators)
-            for msg in user_messages
-        )
-        casual_count = sum(
-            sum(indicator in msg for indicator in casual_indicators) 
-            for msg in user_messages
-        )
-        
-        formality_preference = "formal" if formal_count > casual_count else "casual"
+        if history_stats.formal_count > history_stats.casual_count:
+            formality_preference = "formal"
+        else:
+            formality_preference = "casual"
         
         return {
             "formality_preference": formality_preference,
-            "average_message_length": sum(len(msg) for msg in user_messages) / len(user_messages),
-            "question_frequency": sum("?" in msg or "？" in msg for msg in user_messages) / len(user_messages)
+            "average_message_length": history_stats.user_total_length / history_stats.user_count,
+            "question_frequency": history_stats.question_count / history_stats.user_count
         }
     
     def _check_character_consistency(
         self, 
         character: Character, 
-        conversation_history: List[Dict[str, str]]
+        history_stats: HistoryStats
     ) -> float:
         """检查角色一致性"""
         # 简化的一致性检查
-        char_messages = [
-            msg.get("content", "") for msg in conversation_history
-            if msg.get("role") == "assistant"
-        ]
+        char_messages = history_stats.assistant_contents
         
         if not char_messages:
             return 1.0
         
-        config_data = getattr(character, '_config_data', {})
-        preferred_words = config_data.get('behavioral_constraints', {}).get('preferred_expressions', [])
-        forbidden_words = config_data.get('behavioral_constraints', {}).get('forbidden_words', [])
+        policies = self._character_policies(character)
+        if policies.forbidden_word_pattern is None:
+            return 1.0
         
         consistency_score = 1.0
         
-        # 检查是否使用了禁用词汇
+        # 检查是否使用了禁用词汇：先用单次正则扫描排除不含禁用词的消息
         for msg in char_messages:
-            for forbidden in forbidden_words:
+            if policies.forbidden_word_pattern.search(msg) is None:
+                continue
+            for forbidden in policies.forbidden_words:
                 if forbidden in msg:
                     consistency_score -= 0.1
+            if consistency_score <= 0.0:
+                break
         
         return max(0.0, consistency_score)
     
-    def _assess_interaction_quality(self, conversation_history: List[Dict[str, str]]) -> float:
+    def _assess_interaction_quality(self, history_stats: HistoryStats) -> float:
         """评估互动质量"""
-        if len(conversation_history) < 2:
+        if history_stats.total_count < 2:
             return 0.5
         
-        # 简化的质量评估
-        user_messages = [msg for msg in conversation_history if msg.get("role") == "user"]
-        
-        # 基于消息长度和频率评估
-        avg_length = sum(len(msg.get("content", "")) for msg in user_messages) / len(user_messages)
+        # 简化的质量评估：基于用户消息平均长度
+        avg_length = history_stats.user_total_length / history_stats.user_count
         
         if avg_length > 20:
             return min(1.0, 0.7 + (avg_length - 20) / 100)
         else:
-            return 0.5 
\ No newline at end of file
+            return 0.5
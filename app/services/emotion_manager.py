@@ -5,11 +5,17 @@
 """
 
 import logging
-from typing import Dict, List, Optional, Any
-from datetime import datetime, timedelta
+import time
+from bisect import bisect_right
+from collections import Counter, deque
+from itertools import islice
+from operator import itemgetter
+from typing import Deque, Dict, FrozenSet, List, Optional, Any, Tuple
 from enum import Enum
+from types import MappingProxyType
 
 from app.models import Character, Message
+from app.services.keyword_matching import compile_keyword_pattern, match_keywords
 
 
 class EmotionalState(Enum):
@@ -24,6 +30,88 @@ class EmotionalState(Enum):
     DISAPPOINTED = "disappointed"
 
 
+# 每个会话保留的情感记录数
+MAX_EMOTION_HISTORY = 20
+
+# 情感状态按定义顺序编号，得分和情感记录都按编号存放
+# （枚举值仍保留字符串，对外输出时通过 EMOTION_VALUES 转换）
+EMOTION_ORDER: Tuple[EmotionalState, ...] = tuple(EmotionalState)
+EMOTION_INDEX: Dict[EmotionalState, int] = {state: index for index, state in enumerate(EMOTION_ORDER)}
+EMOTION_VALUES: Tuple[str, ...] = tuple(state.value for state in EMOTION_ORDER)
+CONFUSED_INDEX = EMOTION_INDEX[EmotionalState.CONFUSED]
+EXCITED_INDEX = EMOTION_INDEX[EmotionalState.EXCITED]
+
+# 情感一致性检查只参考该时间窗口（秒）内的最后一条情感记录
+CONSISTENCY_WINDOW_SECONDS = 1800
+
+# 情感强度（按情感编号索引，未列出的情感为0），用于判断情感变化是否过于剧烈
+EMOTION_INTENSITY: Tuple[int, ...] = tuple(
+    {
+        EmotionalState.NEUTRAL: 0,
+        EmotionalState.PLEASED: 2,
+        EmotionalState.CONFUSED: 1,
+        EmotionalState.SAD: -2,
+        EmotionalState.ANGRY: -3,
+        EmotionalState.CARING: 1,
+        EmotionalState.EXCITED: 3
+    }.get(state, 0)
+    for state in EMOTION_ORDER
+)
+
+# 没有配置数据的角色共用的空配置（固定对象，使按配置对象缓存的结果可以命中）
+EMPTY_CONFIG = MappingProxyType({})
+
+# 决定角色情感响应时使用的性格特质分组
+TENDER_TRAITS = frozenset(('温柔', '关怀', '善良'))
+ALOOF_TRAITS = frozenset(('冷淡', '疏离'))
+PROUD_TRAITS = frozenset(('骄傲', '自信', '强势'))
+LIVELY_TRAITS = frozenset(('活泼', '开朗'))
+COMPETITIVE_TRAITS = frozenset(('强势', '好胜'))
+GENTLE_OR_COLD_TRAITS = frozenset(('温柔', '冷淡'))
+INTELLECTUAL_TRAITS = frozenset(('聪明', '知性'))
+RESERVED_TRAITS = frozenset(('冷淡', '内敛'))
+OUTGOING_TRAITS = frozenset(('活泼', '开朗', '热情'))
+QUIET_TRAITS = frozenset(('冷淡', '神秘', '内敛'))
+
+# 角色情感响应决策表：用户情感 -> ((特质分组, 角色情感), ...) 与默认情感
+# 规则按顺序匹配，角色具备分组中任一特质即命中
+ResponseRule = Tuple[Tuple[Tuple[FrozenSet[str], EmotionalState], ...], EmotionalState]
+
+RESPONSE_RULES: Dict[EmotionalState, ResponseRule] = {
+    # 用户难过时
+    EmotionalState.SAD: (
+        ((TENDER_TRAITS, EmotionalState.CARING), (ALOOF_TRAITS, EmotionalState.CONFUSED)),
+        EmotionalState.CARING
+    ),
+    # 用户开心时
+    EmotionalState.PLEASED: (
+        ((PROUD_TRAITS, EmotionalState.PLEASED), (LIVELY_TRAITS, EmotionalState.EXCITED)),
+        EmotionalState.PLEASED
+    ),
+    # 用户生气时
+    EmotionalState.ANGRY: (
+        ((COMPETITIVE_TRAITS, EmotionalState.ANGRY), (GENTLE_OR_COLD_TRAITS, EmotionalState.CONFUSED)),
+        EmotionalState.NEUTRAL
+    ),
+    # 用户困惑时
+    EmotionalState.CONFUSED: (
+        ((INTELLECTUAL_TRAITS, EmotionalState.CARING),),
+        EmotionalState.CONFUSED
+    ),
+    # 用户兴奋时
+    EmotionalState.EXCITED: (
+        ((LIVELY_TRAITS, EmotionalState.EXCITED), (RESERVED_TRAITS, EmotionalState.CONFUSED)),
+        EmotionalState.PLEASED
+    ),
+}
+
+# 其他用户情感：根据角色基础性格
+DEFAULT_RESPONSE_RULE: ResponseRule = (
+    ((OUTGOING_TRAITS, EmotionalState.PLEASED), (QUIET_TRAITS, EmotionalState.NEUTRAL)),
+    EmotionalState.NEUTRAL
+)
+
+
 class EmotionManager:
     """
     情感状态管理器
@@ -34,7 +122,9 @@ class EmotionManager:
     def __init__(self):
         self.logger = logging.getLogger(__name__)
         # 存储每个会话的情感状态历史
-        self._session_emotions: Dict[str, List[Dict[str, Any]]] = {}
+        self._session_emotions: Dict[str, Deque[Dict[str, Any]]] = {}
+        # 角色ID -> (配置数据, 核心特质集合)，配置对象变化（重新加载）时重建
+        self._traits_cache: Dict[str, Tuple[Any, FrozenSet[str]]] = {}
         
         # 情感触发词典
         self.emotion_triggers = {
@@ -51,6 +141,13 @@ class EmotionManager:
                 "不明白", "困惑", "奇怪", "为什么", "怎么回事", "搞不懂"
             ]
         }
+        
+        # 小写触发词 -> 对应情感编号，并编译为单个正则供一次扫描使用
+        self._trigger_emotions: Dict[str, List[int]] = {}
+        for emotion, triggers in self.emotion_triggers.items():
+            for trigger in triggers:
+                self._trigger_emotions.setdefault(trigger.lower(), []).append(EMOTION_INDEX[emotion])
+        self._trigger_pattern, self._implied_triggers = compile_keyword_pattern(self._trigger_emotions)
     
     def analyze_user_message_emotion(self, message: str) -> EmotionalState:
         """
@@ -64,26 +161,28 @@ class EmotionManager:
         """
         message_lower = message.lower()
         
-        # 情感得分统计
-        emotion_scores = {state: 0 for state in EmotionalState}
+        # 情感得分统计（按 EMOTION_ORDER 编号）
+        emotion_scores = [0] * len(EMOTION_ORDER)
         
-        for emotion, triggers in self.emotion_triggers.items():
-            for trigger in triggers:
-                if trigger.lower() in message_lower:
-                    emotion_scores[emotion] += 1
+        # 一次扫描找出出现过的触发词，每个触发词只计一次分；
+        # 先对匹配结果去重，长消息中反复出现的触发词只处理一次
+        matched = match_keywords(self._trigger_pattern, self._implied_triggers, message_lower)
+        for trigger in matched:
+            for emotion in self._trigger_emotions[trigger]:
+                emotion_scores[emotion] += 1
         
         # 特殊情况：问号多表示困惑
         if message.count('?') > 1 or message.count('？') > 1:
-            emotion_scores[EmotionalState.CONFUSED] += 1
+            emotion_scores[CONFUSED_INDEX] += 1
         
         # 感叹号多表示激动
         if message.count('!') > 2 or message.count('！') > 2:
-            emotion_scores[EmotionalState.EXCITED] += 1
+            emotion_scores[EXCITED_INDEX] += 1
         
         # 找到得分最高的情感
-        max_emotion = max(emotion_scores.items(), key=lambda x: x[1])
+        best_index = max(range(len(emotion_scores)), key=emotion_scores.__getitem__)
         
-        return max_emotion[0] if max_emotion[1] > 0 else EmotionalState.NEUTRAL
+        return EMOTION_ORDER[best_index] if emotion_scores[best_index] > 0 else EmotionalState.NEUTRAL
     
     def get_character_emotional_response(
         self, 
@@ -103,69 +202,32 @@ class EmotionManager:
             EmotionalState: 角色应该表现的情感状态
         """
         try:
-            config_data = getattr(character, '_config_data', {})
-            personality_deep = config_data.get('personality_deep', {})
-            core_traits = personality_deep.get('core_traits', [])
+            core_traits = self._core_traits(character)
             
-            # 获取角色历史情感状态
-            recent_emotions = self._get_recent_emotions(session_id)
-            
-            # 根据角色特性和用户情感决定响应
-            if user_emotion == EmotionalState.SAD:
-                # 用户难过时
-                if any(trait in ['温柔', '关怀', '善良'] for trait in core_traits):
-                    return EmotionalState.CARING
-                elif any(trait in ['冷淡', '疏离'] for trait in core_traits):
-                    return EmotionalState.CONFUSED
-                else:
-                    return EmotionalState.CARING
-            
-            elif user_emotion == EmotionalState.PLEASED:
-                # 用户开心时
-                if any(trait in ['骄傲', '自信', '强势'] for trait in core_traits):
-                    return EmotionalState.PLEASED
-                elif any(trait in ['活泼', '开朗'] for trait in core_traits):
-                    return EmotionalState.EXCITED
-                else:
-                    return EmotionalState.PLEASED
-            
-            elif user_emotion == EmotionalState.ANGRY:
-                # 用户生气时
-                if any(trait in ['强势', '好胜'] for trait in core_traits):
-                    return EmotionalState.ANGRY
-                elif any(trait in ['温柔', '冷淡'] for trait in core_traits):
-                    return EmotionalState.CONFUSED
-                else:
-                    return EmotionalState.NEUTRAL
-            
-            elif user_emotion == EmotionalState.CONFUSED:
-                # 用户困惑时
-                if any(trait in ['聪明', '知性'] for trait in core_traits):
-                    return EmotionalState.CARING
-                else:
-                    return EmotionalState.CONFUSED
-                    
-            elif user_emotion == EmotionalState.EXCITED:
-                # 用户兴奋时
-                if any(trait in ['活泼', '开朗'] for trait in core_traits):
-                    return EmotionalState.EXCITED
-                elif any(trait in ['冷淡', '内敛'] for trait in core_traits):
-                    return EmotionalState.CONFUSED
-                else:
-                    return EmotionalState.PLEASED
-            
-            # 默认根据角色基础性格
-            if any(trait in ['活泼', '开朗', '热情'] for trait in core_traits):
-                return EmotionalState.PLEASED
-            elif any(trait in ['冷淡', '神秘', '内敛'] for trait in core_traits):
-                return EmotionalState.NEUTRAL
-            else:
-                return EmotionalState.NEUTRAL
+            # 根据用户情感选择规则，按顺序匹配角色特性
+            rules, default_response = RESPONSE_RULES.get(user_emotion, DEFAULT_RESPONSE_RULE)
+            for trait_group, response in rules:
+                if not core_traits.isdisjoint(trait_group):
+                    return response
+            return default_response
                 
         except Exception as e:
             self.logger.error(f"确定角色情感响应时出错: {e}")
             return EmotionalState.NEUTRAL
     
+    def _core_traits(self, character: Character) -> FrozenSet[str]:
+        """获取角色核心特质集合（按角色缓存，角色配置重新加载后自动重建）"""
+        config_data = getattr(character, '_config_data', EMPTY_CONFIG)
+        cached = self._traits_cache.get(character.id)
+        if cached is not None and cached[0] is config_data:
+            return cached[1]
+        
+        personality_deep = config_data.get('personality_deep', {})
+        core_traits = frozenset(personality_deep.get('core_traits', []))
+        
+        self._traits_cache[character.id] = (config_data, core_traits)
+        return core_traits
+    
     def update_emotion_history(
         self, 
         session_id: str, 
@@ -180,20 +242,20 @@ class EmotionManager:
             user_emotion: 用户情感
             character_emotion: 角色情感
         """
-        if session_id not in self._session_emotions:
-            self._session_emotions[session_id] = []
+        history = self._session_emotions.get(session_id)
+        if history is None:
+            # 定长队列，超出 MAX_EMOTION_HISTORY 时自动丢弃最早的记录
+            history = self._session_emotions[session_id] = deque(maxlen=MAX_EMOTION_HISTORY)
         
         emotion_record = {
-            'timestamp': datetime.now(),
-            'user_emotion': user_emotion.value,
-            'character_emotion': character_emotion.value
+            # 单调时钟时间，记录按时间先后追加，可直接二分查找
+            'timestamp': time.monotonic(),
+            # 保存情感编号，统计时再转换为枚举值字符串
+            'user_emotion': EMOTION_INDEX[user_emotion],
+            'character_emotion': EMOTION_INDEX[character_emotion]
         }
         
-        self._session_emotions[session_id].append(emotion_record)
-        
-        # 保持最近20条记录
-        if len(self._session_emotions[session_id]) > 20:
-            self._session_emotions[session_id] = self._session_emotions[session_id][-20:]
+        history.append(emotion_record)
     
     def _get_recent_emotions(self, session_id: str, hours: int = 1) -> List[Dict[str, Any]]:
         """
@@ -206,16 +268,14 @@ class EmotionManager:
         Returns:
             List[Dict]: 情感记录列表
         """
-        if session_id not in self._session_emotions:
+        history = self._session_emotions.get(session_id)
+        if not history:
             return []
         
-        cutoff_time = datetime.now() - timedelta(hours=hours)
-        recent_emotions = [
-            record for record in self._session_emotions[session_id]
-            if record['timestamp'] > cutoff_time
-        ]
+        cutoff_time = time.monotonic() - hours * 3600
+        start = bisect_right(history, cutoff_time, key=itemgetter('timestamp'))
         
-        return recent_emotions
+        return list(islice(history, start, None))
     
     def get_emotion_consistency_modifier(
         self, 
@@ -235,32 +295,22 @@ class EmotionManager:
             str: 情感修饰提示
         """
         try:
-            recent_emotions = self._get_recent_emotions(session_id, hours=0.5)
-            
-            if not recent_emotions:
+            # 记录按时间顺序追加，只需检查最后一条是否仍在时间窗口内
+            history = self._session_emotions.get(session_id)
+            if not history or history[-1]['timestamp'] <= time.monotonic() - CONSISTENCY_WINDOW_SECONDS:
                 return ""
             
-            last_emotion = recent_emotions[-1]['character_emotion']
+            last_emotion = history[-1]['character_emotion']
             
             # 检查情感变化是否过于剧烈
-            emotion_intensity = {
-                EmotionalState.NEUTRAL.value: 0,
-                EmotionalState.PLEASED.value: 2,
-                EmotionalState.CONFUSED.value: 1,
-                EmotionalState.SAD.value: -2,
-                EmotionalState.ANGRY.value: -3,
-                EmotionalState.CARING.value: 1,
-                EmotionalState.EXCITED.value: 3
-            }
-            
-            last_intensity = emotion_intensity.get(last_emotion, 0)
-            target_intensity = emotion_intensity.get(target_emotion.value, 0)
+            last_intensity = EMOTION_INTENSITY[last_emotion]
+            target_intensity = EMOTION_INTENSITY[EMOTION_INDEX[target_emotion]]
             
             intensity_diff = abs(target_intensity - last_intensity)
             
             if intensity_diff > 3:
                 # 情感变化过大，需要过渡
-                return f"\n请注意：你的情感状态从{last_emotion}逐渐转向{target_emotion.value}，变化应该自然而不突兀。"
+                return f"\n请注意：你的情感状态从{EMOTION_VALUES[last_emotion]}逐渐转向{target_emotion.value}，变化应该自然而不突兀。"
             
             return ""
             
@@ -295,19 +345,19 @@ class EmotionManager:
         total = len(emotions)
         
         # 统计角色情感分布
-        character_emotions = [e['character_emotion'] for e in emotions]
-        emotion_counts = {}
-        for emotion in character_emotions:
-            emotion_counts[emotion] = emotion_counts.get(emotion, 0) + 1
+        emotion_counts = Counter(e['character_emotion'] for e in emotions)
         
         # 计算百分比
         emotion_distribution = {
-            emotion: (count / total) * 100 
+            EMOTION_VALUES[emotion]: (count / total) * 100 
             for emotion, count in emotion_counts.items()
         }
         
         return {
             'total_interactions': total,
             'emotion_distribution': emotion_distribution,
-            'recent_trend': character_emotions[-5:] if len(character_emotions) >= 5 else character_emotions
+            'recent_trend': [
+                EMOTION_VALUES[e['character_emotion']]
+                for e in islice(emotions, max(total - 5, 0), None)
+            ]
         } 
\ No newline at end of file
@@ -0,0 +1,67 @@
+"""
+关键词匹配工具
+
+将多个关键词编译为单个正则，一次扫描即可完成多关键词匹配。
+"""
+
+import re
+from functools import lru_cache
+from typing import Dict, Iterable, Set, Tuple
+
+
+@lru_cache(maxsize=256)
+def compile_keywords(keywords: Tuple[str, ...], overlapping: bool = False) -> re.Pattern:
+    """
+    将关键词编译为单个正则，一次扫描即可完成多关键词匹配
+    
+    Args:
+        keywords: 关键词元组（不能为空）
+        overlapping: 是否允许不同位置开始的匹配相互重叠
+    
+    Returns:
+        re.Pattern: 编译后的正则
+    """
+    alternation = "|".join(map(re.escape, sorted(keywords, key=len, reverse=True)))
+    if overlapping:
+        return re.compile(f"(?=({alternation}))")
+    return re.compile(alternation)
+
+
+def compile_keyword_pattern(keywords: Iterable[str]) -> Tuple[re.Pattern, Dict[str, Tuple[str, ...]]]:
+    """
+    将关键词编译为可找出消息中全部关键词的正则
+    
+    使用零宽前瞻使不同位置开始的匹配可以重叠（如"生气死了"同时命中"生气"和"气死了"）；
+    同一位置只能命中最长的关键词，因此额外记录每个关键词所隐含的、作为其前缀的较短关键词
+    （如"家人"隐含"家"）。
+    
+    Args:
+        keywords: 关键词集合
+    
+    Returns:
+        Tuple[re.Pattern, Dict[str, Tuple[str, ...]]]: 编译后的正则和关键词到其隐含关键词的映射
+    """
+    ordered = tuple(sorted(set(keywords), key=len, reverse=True))
+    implied = {
+        keyword: tuple(other for other in ordered if keyword.startswith(other))
+        for keyword in ordered
+    }
+    return compile_keywords(ordered, overlapping=True), implied
+
+
+def match_keywords(pattern: re.Pattern, implied: Dict[str, Tuple[str, ...]], text: str) -> Set[str]:
+    """
+    一次扫描找出文本中出现的全部关键词
+    
+    Args:
+        pattern: compile_keyword_pattern 返回的正则
+        implied: compile_keyword_pattern 返回的隐含关键词映射
+        text: 待扫描文本
+    
+    Returns:
+        Set[str]: 出现过的关键词
+    """
+    matched = set()
+    for keyword in set(pattern.findall(text)):
+        matched.update(implied[keyword])
+    return matched
@@ -5,17 +5,98 @@ LLM连接服务
 """
 
 import asyncio
+import random
 import time
 from abc import ABC, abstractmethod
-from typing import List, Dict, Optional, AsyncGenerator
+from functools import lru_cache, partial
+from typing import Any, Callable, List, Dict, Optional, AsyncGenerator
 import httpx
+import orjson
 import google.generativeai as genai
-from openai import AsyncOpenAI
+from openai import AsyncOpenAI, APIConnectionError, APITimeoutError
 
 from app.core import settings, LLMProviderError, LLMAPIError, LLMTimeoutError
 from app.models import LLMProvider
 
 
+# 共享HTTP连接池配置：所有提供商复用同一组长连接（HTTP/2多路复用）
+HTTP_MAX_CONNECTIONS = 100
+HTTP_MAX_KEEPALIVE_CONNECTIONS = 50
+
+# 重试退避：第n次重试前等待 RETRY_BASE_DELAY * 2^n 秒，再加上随机抖动避免同时重试
+RETRY_BASE_DELAY = 0.5
+RETRY_MAX_JITTER = 0.25
+
+# 值得重试的瞬时错误：超时、网络传输错误，以及限流/服务端错误状态码
+TIMEOUT_EXCEPTIONS = (httpx.TimeoutException, asyncio.TimeoutError, APITimeoutError)
+TRANSIENT_EXCEPTIONS = (httpx.TransportError, APIConnectionError, LLMTimeoutError) + TIMEOUT_EXCEPTIONS
+RETRYABLE_STATUS_CODES = frozenset((429, 500, 502, 503, 504))
+
+# Gemini格式消息转换缓存大小（按消息条数计）
+GEMINI_MESSAGE_CACHE_SIZE = 1024
+
+
+def _status_code(error: BaseException) -> Optional[int]:
+    """提取SDK异常中的HTTP状态码（OpenAI为status_code，Google API为code）"""
+    for attr in ("status_code", "code"):
+        value = getattr(error, attr, None)
+        if isinstance(value, int):
+            return value
+    # httpx.HTTPStatusError 的状态码在响应对象上
+    response = getattr(error, "response", None)
+    if isinstance(getattr(response, "status_code", None), int):
+        return response.status_code
+    if isinstance(error, LLMAPIError):
+        return error.details.get("status_code")
+    return None
+
+
+def _is_retryable_error(error: Optional[BaseException]) -> bool:
+    """判断异常（含其原始异常链）是否为值得重试的瞬时错误"""
+    while error is not None:
+        if isinstance(error, TRANSIENT_EXCEPTIONS) or _status_code(error) in RETRYABLE_STATUS_CODES:
+            return True
+        error = error.__cause__
+    return False
+
+
+@lru_cache(maxsize=None)
+def _configure_gemini(api_key: str) -> None:
+    """配置Gemini SDK（全局状态，同一密钥只配置一次）"""
+    genai.configure(api_key=api_key)
+
+
+@lru_cache(maxsize=GEMINI_MESSAGE_CACHE_SIZE)
+def _to_gemini_message(role: str, content: str) -> Dict:
+    """
+    将单条标准消息转换为Gemini格式
+    
+    多轮对话中历史消息每次都会重新发送，按(角色, 内容)缓存转换结果，
+    每轮只需转换新增的消息。返回的字典在多次调用间共享，调用方不应修改。
+    
+    Args:
+        role: 消息角色
+        content: 消息内容
+        
+    Returns:
+        Dict: Gemini格式的消息
+    """
+    # Gemini的角色映射
+    if role == "user":
+        gemini_role = "user"
+    elif role == "assistant":
+        gemini_role = "model"
+    else:  # system messages
+        # Gemini没有system角色，将其合并到用户消息中
+        gemini_role = "user"
+        content = f"[系统消息]: {content}"
+    
+    return {
+        "role": gemini_role,
+        "parts": [{"text": content}]
+    }
+
+
 class AbstractLLMProvider(ABC):
     """
     LLM提供商抽象基类
@@ -72,10 +153,24 @@ class AbstractLLMProvider(ABC):
         """
         pass
     
+    def _prepare_request(self, request_kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        请求发出前对参数做一次性预处理，同一次请求的所有重试共用结果
+        
+        Args:
+            request_kwargs: 传给 generate_response 的参数
+            
+        Returns:
+            Dict[str, Any]: 处理后的参数（默认原样返回）
+        """
+        return request_kwargs
+    
     async def _retry_request(self, func, *args, **kwargs):
         """
         重试机制
         
+        只重试超时、网络错误和限流/服务端错误，其他错误（如参数错误、认证失败）直接抛出。
+        
         Args:
             func: 要重试的函数
             *args: 位置参数
@@ -90,20 +185,39 @@ class AbstractLLMProvider(ABC):
             try:
                 return await func(*args, **kwargs)
             except Exception as e:
+                if not _is_retryable_error(e):
+                    raise
                 last_exception = e
                 if attempt < self.max_retries:
-                    # 指数退避
-                    wait_time = (2 ** attempt) * 0.5
+                    # 指数退避 + 随机抖动
+                    wait_time = (2 ** attempt) * RETRY_BASE_DELAY + random.uniform(0, RETRY_MAX_JITTER)
                     await asyncio.sleep(wait_time)
                     continue
                 break
         
-        # 所有重试都失败，抛出最后一个异常
+        # 所有重试都失败，抛出最后一个异常（超时保持为超时异常）
+        if isinstance(last_exception, LLMTimeoutError):
+            raise last_exception
         if last_exception:
             raise LLMAPIError(
                 self.provider_name,
-                f"重试{self.max_retries}次后仍然失败: {str(last_exception)}"
-            )
+                f"重试{self.max_retries}次后仍然失败: {str(last_exception)}",
+                status_code=_status_code(last_exception)
+            ) from last_exception
+    
+    def _wrap_error(self, error: Exception) -> Exception:
+        """
+        将SDK异常转换为业务异常，保留超时类型和HTTP状态码供重试判断
+        
+        Args:
+            error: 原始异常
+            
+        Returns:
+            Exception: LLMTimeoutError 或 LLMAPIError
+        """
+        if isinstance(error, TIMEOUT_EXCEPTIONS):
+            return LLMTimeoutError(self.provider_name, self.timeout)
+        return LLMAPIError(self.provider_name, str(error), status_code=_status_code(error))
 
 
 class GeminiProvider(AbstractLLMProvider):
@@ -118,7 +232,7 @@ class GeminiProvider(AbstractLLMProvider):
             raise LLMProviderError("gemini", "未提供Gemini API密钥")
         
         # 配置Gemini
-        genai.configure(api_key=settings.gemini_api_key)
+        _configure_gemini(settings.gemini_api_key)
         self.model_name = settings.gemini_model
         
         # 创建模型实例
@@ -134,28 +248,7 @@ class GeminiProvider(AbstractLLMProvider):
         Returns:
             List[Dict]: Gemini格式的消息列表
         """
-        gemini_messages = []
-        
-        for msg in messages:
-            role = msg["role"]
-            content = msg["content"]
-            
-            # Gemini的角色映射
-            if role == "user":
-                gemini_role = "user"
-            elif role == "assistant":
-                gemini_role = "model"
-            else:  # system messages
-                # Gemini没有system角色，将其合并到用户消息中
-                gemini_role = "user"
-                content = f"[系统消息]: {content}"
-            
-            gemini_messages.append({
-                "role": gemini_role,
-                "parts": [{"text": content}]
-            })
-        
-        return gemini_messages
+        return [_to_gemini_message(msg["role"], msg["content"]) for msg in messages]
     
     async def generate_response(
         self,
@@ -190,9 +283,8 @@ class GeminiProvider(AbstractLLMProvider):
             # 创建聊天会话
             chat = self.model.start_chat(history=history)
             
-            # 发送消息并获取回复
-            response = await asyncio.to_thread(
-                chat.send_message,
+            # 发送消息并获取回复（SDK原生异步接口，不占用线程池）
+            response = await chat.send_message_async(
                 user_message,
                 generation_config=generation_config
             )
@@ -208,7 +300,7 @@ class GeminiProvider(AbstractLLMProvider):
             }
             
         except Exception as e:
-            raise LLMAPIError(self.provider_name, str(e))
+            raise self._wrap_error(e) from e
     
     async def generate_stream_response(
         self,
@@ -241,20 +333,19 @@ class GeminiProvider(AbstractLLMProvider):
             # 创建聊天会话
             chat = self.model.start_chat(history=history)
             
-            # 流式生成回复
-            response_stream = await asyncio.to_thread(
-                chat.send_message,
+            # 流式生成回复（SDK原生异步接口，不占用线程池）
+            response_stream = await chat.send_message_async(
                 user_message,
                 generation_config=generation_config,
                 stream=True
             )
             
-            for chunk in response_stream:
+            async for chunk in response_stream:
                 if chunk.text:
                     yield chunk.text
                     
         except Exception as e:
-            raise LLMAPIError(self.provider_name, str(e))
+            raise self._wrap_error(e) from e
 
 
 class DeepSeekProvider(AbstractLLMProvider):
@@ -262,52 +353,95 @@ class DeepSeekProvider(AbstractLLMProvider):
     DeepSeek API提供商实现
     """
     
-    def __init__(self):
+    def __init__(self, http_client: Optional[httpx.AsyncClient] = None):
+        """
+        Args:
+            http_client: 共享的HTTP客户端，None则单独创建
+        """
         super().__init__("deepseek")
         
         if not settings.deepseek_api_key:
             raise LLMProviderError("deepseek", "未提供DeepSeek API密钥")
         
-        # 创建OpenAI兼容的客户端
+        self._http_client = http_client or httpx.AsyncClient(timeout=self.timeout)
+        self._completions_url = settings.deepseek_base_url.rstrip("/") + "/chat/completions"
+        self._headers = {
+            "Authorization": f"Bearer {settings.deepseek_api_key}",
+            "Content-Type": "application/json"
+        }
+
+        # 创建OpenAI兼容的客户端（用于流式响应）
         self.client = AsyncOpenAI(
             api_key=settings.deepseek_api_key,
-            base_url=settings.deepseek_base_url
+            base_url=settings.deepseek_base_url,
+            http_client=self._http_client
         )
         self.model_name = settings.deepseek_model
     
+    def _serialize_payload(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float = 0.8,
+        max_tokens: Optional[int] = None
+    ) -> bytes:
+        """序列化请求体"""
+        return orjson.dumps({
+            "model": self.model_name,
+            "messages": messages,
+            "temperature": temperature,
+            "max_tokens": max_tokens or settings.default_max_tokens
+        })
+    
+    def _prepare_request(self, request_kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        """预先序列化请求体，重试时直接复用，避免每次重试都重新序列化完整的对话历史"""
+        payload = self._serialize_payload(
+            request_kwargs["messages"],
+            request_kwargs.get("temperature", 0.8),
+            request_kwargs.get("max_tokens")
+        )
+        return {**request_kwargs, "payload": payload}
+    
     async def generate_response(
         self,
         messages: List[Dict[str, str]],
         temperature: float = 0.8,
         max_tokens: Optional[int] = None,
+        payload: Optional[bytes] = None,
         **kwargs
     ) -> Dict:
         """
         生成AI回复
+        
+        Args:
+            payload: 已序列化的请求体（由 _prepare_request 生成），None则按其他参数序列化
         """
         start_time = time.time()
         
         try:
-            response = await self.client.chat.completions.create(
-                model=self.model_name,
-                messages=messages,
-                temperature=temperature,
-                max_tokens=max_tokens or settings.default_max_tokens,
+            if payload is None:
+                payload = self._serialize_payload(messages, temperature, max_tokens)
+            response = await self._http_client.post(
+                self._completions_url,
+                content=payload,
+                headers=self._headers,
                 timeout=self.timeout
             )
+            response.raise_for_status()
+            data = orjson.loads(response.content)
             
             response_time = time.time() - start_time
+            usage = data.get("usage")
             
             return {
-                "content": response.choices[0].message.content,
-                "tokens_used": response.usage.total_tokens if response.usage else None,
+                "content": data["choices"][0]["message"]["content"],
+                "tokens_used": usage.get("total_tokens") if usage else None,
                 "model": self.model_name,
                 "provider": self.provider_name,
                 "response_time": response_time
             }
             
         except Exception as e:
-            raise LLMAPIError(self.provider_name, str(e))
+            raise self._wrap_error(e) from e
     
     async def generate_stream_response(
         self,
@@ -334,7 +468,7 @@ class DeepSeekProvider(AbstractLLMProvider):
                     yield chunk.choices[0].delta.content
                     
         except Exception as e:
-            raise LLMAPIError(self.provider_name, str(e))
+            raise self._wrap_error(e) from e
 
 
 class LLMConnector:
@@ -345,36 +479,93 @@ class LLMConnector:
     """
     
     def __init__(self):
+        # 已创建的提供商实例；提供商在首次使用时才创建
         self.providers: Dict[str, AbstractLLMProvider] = {}
+        # 已配置（提供了API密钥）的提供商 -> 创建函数
+        self._factories: Dict[str, Callable[[], AbstractLLMProvider]] = {}
         self.default_provider = settings.default_llm_provider
         
+        # 所有提供商共享的HTTP客户端（连接池 + keep-alive + HTTP/2）
+        self._http_client = httpx.AsyncClient(
+            http2=True,
+            limits=httpx.Limits(
+                max_connections=HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS
+            ),
+            timeout=settings.request_timeout_seconds
+        )
+        
         # 初始化提供商
         self._initialize_providers()
     
     def _initialize_providers(self):
-        """初始化所有可用的LLM提供商"""
-        # 初始化Gemini
+        """登记所有已配置的LLM提供商（实例在首次使用时创建）"""
+        # Gemini
         if settings.gemini_api_key:
-            try:
-                self.providers[LLMProvider.GEMINI] = GeminiProvider()
-            except Exception as e:
-                print(f"Gemini初始化失败: {e}")
+            self._factories[LLMProvider.GEMINI] = GeminiProvider
         
-        # 初始化DeepSeek
+        # DeepSeek
         if settings.deepseek_api_key:
-            try:
-                self.providers[LLMProvider.DEEPSEEK] = DeepSeekProvider()
-            except Exception as e:
-                print(f"DeepSeek初始化失败: {e}")
+            self._factories[LLMProvider.DEEPSEEK] = partial(DeepSeekProvider, http_client=self._http_client)
         
-        if not self.providers:
+        if not self._factories:
             raise LLMProviderError("none", "没有可用的LLM提供商")
         
         # 确保默认提供商可用
-        if self.default_provider not in self.providers:
-            self.default_provider = list(self.providers.keys())[0]
+        if self.default_provider not in self._factories:
+            self.default_provider = next(iter(self._factories))
             print(f"默认LLM提供商不可用，切换到: {self.default_provider}")
     
+    def _get_provider(self, provider: str) -> AbstractLLMProvider:
+        """
+        获取提供商实例，首次使用时创建
+        
+        Args:
+            provider: 提供商名称
+            
+        Returns:
+            AbstractLLMProvider: 提供商实例
+            
+        Raises:
+            LLMProviderError: 提供商未配置或创建失败
+        """
+        provider_obj = self.providers.get(provider)
+        if provider_obj is not None:
+            return provider_obj
+        
+        factory = self._factories.get(provider)
+        if factory is None:
+            raise LLMProviderError(provider, "提供商不存在")
+        
+        try:
+            provider_obj = factory()
+        except Exception as e:
+            # 创建失败的提供商不再视为可用
+            del self._factories[provider]
+            print(f"{provider}初始化失败: {e}")
+            raise LLMProviderError(provider, f"初始化失败: {e}") from e
+        
+        self.providers[provider] = provider_obj
+        return provider_obj
+    
+    async def _request_provider(self, provider: str, retry: bool, **request_kwargs) -> Dict:
+        """
+        调用指定提供商生成回复
+        
+        Args:
+            provider: 提供商名称
+            retry: 是否使用重试机制
+            **request_kwargs: 传给提供商 generate_response 的参数
+            
+        Returns:
+            Dict: 包含回复内容和元数据的字典
+        """
+        provider_obj = self._get_provider(provider)
+        request_kwargs = provider_obj._prepare_request(request_kwargs)
+        if retry:
+            return await provider_obj._retry_request(provider_obj.generate_response, **request_kwargs)
+        return await provider_obj.generate_response(**request_kwargs)
+    
     async def generate_response(
         self,
         messages: List[Dict[str, str]],
@@ -398,18 +589,28 @@ class LLMConnector:
         """
         provider = provider or self.default_provider
         
-        if provider not in self.providers:
+        if provider not in self._factories:
             # 尝试回退到可用的提供商
-            available_providers = list(self.providers.keys())
+            available_providers = list(self._factories.keys())
             if available_providers:
                 provider = available_providers[0]
                 print(f"指定的提供商不可用，回退到: {provider}")
             else:
                 raise LLMProviderError(provider, "没有可用的LLM提供商")
         
+        if settings.enable_hedged_requests and len(self._factories) > 1:
+            return await self._generate_hedged_response(
+                provider,
+                messages=messages,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                **kwargs
+            )
+        
         try:
-            return await self.providers[provider]._retry_request(
-                self.providers[provider].generate_response,
+            return await self._request_provider(
+                provider,
+                retry=True,
                 messages=messages,
                 temperature=temperature,
                 max_tokens=max_tokens,
@@ -417,11 +618,13 @@ class LLMConnector:
             )
         except Exception as e:
             # 如果主提供商失败，尝试其他提供商
-            for fallback_provider in self.providers:
+            for fallback_provider in list(self._factories):
                 if fallback_provider != provider:
                     try:
                         print(f"主提供商{provider}失败，尝试{fallback_provider}")
-                        return await self.providers[fallback_provider].generate_response(
+                        return await self._request_provider(
+                            fallback_provider,
+                            retry=False,
                             messages=messages,
                             temperature=temperature,
                             max_tokens=max_tokens,
@@ -433,6 +636,57 @@ class LLMConnector:
             # 所有提供商都失败
             raise e
     
+    async def _generate_hedged_response(self, provider: str, **request_kwargs) -> Dict:
+        """
+        对冲请求：主提供商在 hedge_delay_seconds 内未返回（或已失败）时，
+        并行请求下一个提供商，采用最先成功的结果并取消其余请求
+        
+        Args:
+            provider: 主提供商
+            **request_kwargs: 传给提供商 generate_response 的参数
+            
+        Returns:
+            Dict: 包含回复内容和元数据的字典
+        """
+        backups = [name for name in self._factories if name != provider]
+        
+        # 主提供商带重试，备用提供商只请求一次（与串行回退一致）
+        primary_task = asyncio.create_task(
+            self._request_provider(provider, retry=True, **request_kwargs)
+        )
+        pending = {primary_task}
+        last_exception: Optional[BaseException] = None
+        
+        try:
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending,
+                    timeout=settings.hedge_delay_seconds if backups else None,
+                    return_when=asyncio.FIRST_COMPLETED
+                )
+                
+                failed = False
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    failed = True
+                    if last_exception is None or task is primary_task:
+                        last_exception = task.exception()
+                
+                # 超时或有请求失败时，启动下一个备用提供商
+                if backups and (failed or not done):
+                    fallback_provider = backups.pop(0)
+                    print(f"主提供商{provider}响应慢或失败，并行尝试{fallback_provider}")
+                    pending.add(asyncio.create_task(
+                        self._request_provider(fallback_provider, retry=False, **request_kwargs)
+                    ))
+        finally:
+            for task in pending:
+                task.cancel()
+        
+        # 所有提供商都失败
+        raise last_exception
+    
     async def generate_stream_response(
         self,
         messages: List[Dict[str, str]],
@@ -456,14 +710,14 @@ class LLMConnector:
         """
         provider = provider or self.default_provider
         
-        if provider not in self.providers:
-            available_providers = list(self.providers.keys())
+        if provider not in self._factories:
+            available_providers = list(self._factories.keys())
             if available_providers:
                 provider = available_providers[0]
             else:
                 raise LLMProviderError(provider, "没有可用的LLM提供商")
         
-        async for chunk in self.providers[provider].generate_stream_response(
+        async for chunk in self._get_provider(provider).generate_stream_response(
             messages=messages,
             temperature=temperature,
             max_tokens=max_tokens,
@@ -471,18 +725,39 @@ class LLMConnector:
         ):
             yield chunk
     
+    async def aclose(self) -> None:
+        """关闭共享的HTTP客户端，应在应用关闭时调用"""
+        await self._http_client.aclose()
+    
     def get_available_providers(self) -> List[str]:
         """获取可用的提供商列表"""
-        return list(self.providers.keys())
+        return list(self._factories.keys())
     
     def get_provider_info(self, provider: str) -> Dict:
         """获取提供商信息"""
-        if provider not in self.providers:
-            raise LLMProviderError(provider, "提供商不存在")
-        
-        provider_obj = self.providers[provider]
+        provider_obj = self._get_provider(provider)
         return {
             "name": provider,
             "model": getattr(provider_obj, 'model_name', 'unknown'),
             "available": True
-        } 
\ No newline at end of file
+        }
+
+
+@lru_cache()
+def get_llm_connector() -> LLMConnector:
+    """
+    获取进程内共享的LLM连接器（单例模式）
+    
+    所有请求共用同一个连接器及其HTTP连接池，首次调用时创建。
+    
+    Returns:
+        LLMConnector: 连接器实例
+    """
+    return LLMConnector()
+
+
+async def close_llm_connector() -> None:
+    """关闭共享的LLM连接器（应用关闭时调用，尚未创建时不做任何事）"""
+    if get_llm_connector.cache_info().currsize:
+        await get_llm_connector().aclose()
+        get_llm_connector.cache_clear()
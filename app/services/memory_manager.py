@@ -6,13 +6,39 @@
 
 import logging
 import json
-from typing import Dict, List, Optional, Any, Tuple
+from typing import Dict, FrozenSet, Iterable, List, Optional, Any, Set, Tuple
 from datetime import datetime, timedelta
 from enum import Enum
-from dataclasses import dataclass, asdict
+from dataclasses import dataclass, asdict, field
+from collections import Counter
+from itertools import islice
+from functools import lru_cache
+from operator import itemgetter
+import heapq
 import re
 
 from app.models import Character, Message, Session
+from app.services.keyword_matching import compile_keyword_pattern, match_keywords
+
+
+# 记忆类型指示词
+PREFERENCE_INDICATORS = frozenset(("喜欢", "不喜欢", "爱好", "兴趣", "最喜欢", "讨厌"))
+FACTUAL_INDICATORS = frozenset(("是", "在", "有", "会", "能", "做", "工作", "学习", "家"))
+RELATIONSHIP_INDICATORS = frozenset(("朋友", "家人", "同事", "恋人", "我们", "一起"))
+
+# 关键词提取：按单词切分，过滤停用词，每条消息最多保留的关键词数
+WORD_PATTERN = re.compile(r'\w+')
+STOP_WORDS = frozenset(("的", "了", "在", "是", "我", "你", "他", "她", "它", "这", "那", "有", "和", "与"))
+MAX_KEYWORDS = 10
+
+# 每个会话最多保留的记忆数
+MAX_MEMORIES_PER_SESSION = 100
+
+# 消息分析结果缓存的大小（同一条消息在提取记忆和检索记忆时会被重复分析）
+MESSAGE_ANALYSIS_CACHE_SIZE = 256
+
+# 会话键：(角色ID, 会话ID)
+SessionKey = Tuple[str, str]
 
 
 class MemoryType(Enum):
@@ -32,6 +58,23 @@ class MemoryImportance(Enum):
     LOW = "low"                # 低重要性
 
 
+# 相关性评分中的重要性权重
+IMPORTANCE_WEIGHTS: Dict[MemoryImportance, int] = {
+    MemoryImportance.CRITICAL: 50,
+    MemoryImportance.HIGH: 30,
+    MemoryImportance.MEDIUM: 20,
+    MemoryImportance.LOW: 10
+}
+
+# 重要性等级（数值越大越重要），记忆过多时按此淘汰
+IMPORTANCE_RANK: Dict[MemoryImportance, int] = {
+    MemoryImportance.CRITICAL: 3,
+    MemoryImportance.HIGH: 2,
+    MemoryImportance.MEDIUM: 1,
+    MemoryImportance.LOW: 0
+}
+
+
 @dataclass
 class MemoryItem:
     """记忆项数据结构"""
@@ -50,13 +93,44 @@ class MemoryItem:
     expires_at: Optional[datetime] = None
 
 
+@dataclass(slots=True)
+class _SessionStats:
+    """单个会话的记忆统计（随记忆写入和访问增量更新）"""
+    by_type: Counter = field(default_factory=Counter)
+    by_importance: Counter = field(default_factory=Counter)
+    total_access: int = 0
+    # 访问次数最多的记忆在会话列表中的位置（并列时取靠前的）
+    most_accessed_index: Optional[int] = None
+    most_accessed_count: int = -1
+    
+    def add(self, memories: Iterable[MemoryItem], start_index: int):
+        """记录从 start_index 开始追加到会话列表的记忆"""
+        for index, memory in enumerate(memories, start_index):
+            self.by_type[memory.memory_type.value] += 1
+            self.by_importance[memory.importance.value] += 1
+            self.total_access += memory.access_count
+            self.record_access(memory, index)
+    
+    def record_access(self, memory: MemoryItem, index: int):
+        """记忆访问次数变化后更新最常访问的记忆"""
+        if memory.access_count > self.most_accessed_count or (
+            memory.access_count == self.most_accessed_count and index < self.most_accessed_index
+        ):
+            self.most_accessed_index = index
+            self.most_accessed_count = memory.access_count
+
+
 class MemoryManager:
     """会话记忆管理器"""
     
     def __init__(self):
         self.logger = logging.getLogger(__name__)
-        # 存储记忆数据
-        self._memories: Dict[str, List[MemoryItem]] = {}
+        # 存储记忆数据，以 (角色ID, 会话ID) 为键
+        self._memories: Dict[SessionKey, List[MemoryItem]] = {}
+        # 每个会话中最早的过期时间，未到该时间且记忆未超量时无需清理
+        self._next_expiry: Dict[SessionKey, datetime] = {}
+        # 每个会话的统计信息
+        self._stats: Dict[SessionKey, _SessionStats] = {}
         
         # 重要性关键词
         self.importance_keywords = {
@@ -90,6 +164,26 @@ class MemoryManager:
             MemoryImportance.MEDIUM: timedelta(days=30),    # 1个月
             MemoryImportance.LOW: timedelta(days=7)         # 1周
         }
+        
+        # 各类关键词集合，以及覆盖全部关键词的单个正则：每条消息只扫描一次，
+        # 之后各项判断只需做集合运算
+        self._importance_keyword_sets: List[Tuple[MemoryImportance, FrozenSet[str]]] = [
+            (importance, frozenset(keywords))
+            for importance, keywords in self.importance_keywords.items()
+        ]
+        self._emotion_keyword_sets: List[Tuple[str, FrozenSet[str]]] = [
+            (emotion, frozenset(keywords))
+            for emotion, keywords in self.emotion_keywords.items()
+        ]
+        all_keywords = set(PREFERENCE_INDICATORS | FACTUAL_INDICATORS | RELATIONSHIP_INDICATORS)
+        for keywords in self.importance_keywords.values():
+            all_keywords.update(keywords)
+        for keywords in self.emotion_keywords.values():
+            all_keywords.update(keywords)
+        self._keyword_pattern, self._implied_keywords = compile_keyword_pattern(all_keywords)
+        
+        # 按消息文本缓存分析结果
+        self._analyze_text = lru_cache(maxsize=MESSAGE_ANALYSIS_CACHE_SIZE)(self._analyze_text_uncached)
     
     def extract_memories_from_conversation(
         self,
@@ -126,14 +220,26 @@ class MemoryManager:
         memories.extend(character_memories)
         
         # 存储记忆
-        session_key = f"{character_id}_{session_id}"
+        session_key = (character_id, session_id)
         if session_key not in self._memories:
             self._memories[session_key] = []
+            self._stats[session_key] = _SessionStats()
         
+        self._stats[session_key].add(memories, len(self._memories[session_key]))
         self._memories[session_key].extend(memories)
         
-        # 清理过期记忆
-        self._cleanup_expired_memories(session_key)
+        for memory in memories:
+            next_expiry = self._next_expiry.get(session_key)
+            if memory.expires_at is not None and (next_expiry is None or memory.expires_at < next_expiry):
+                self._next_expiry[session_key] = memory.expires_at
+        
+        # 清理过期记忆（只在有记忆到期或记忆超量时进行）
+        next_expiry = self._next_expiry.get(session_key)
+        if (
+            len(self._memories[session_key]) > MAX_MEMORIES_PER_SESSION
+            or (next_expiry is not None and next_expiry <= now)
+        ):
+            self._cleanup_expired_memories(session_key)
         
         return memories
     
@@ -148,17 +254,10 @@ class MemoryManager:
         """分析消息提取记忆"""
         memories = []
         
-        # 检测重要性
-        importance = self._determine_importance(message)
-        
-        # 检测记忆类型
-        memory_types = self._classify_memory_types(message)
-        
-        # 提取关键词
-        keywords = self._extract_keywords(message)
-        
-        # 检测情感
-        emotions = self._detect_emotions(message)
+        importance, memory_types, keywords, emotions = self._analyze_text(message)
+        # 缓存中的结果是共享的，记忆项使用各自的列表
+        keywords = list(keywords)
+        emotions = list(emotions)
         
         # 为每种记忆类型创建记忆项
         for memory_type in memory_types:
@@ -187,15 +286,49 @@ class MemoryManager:
         
         return memories
     
-    def _determine_importance(self, message: str) -> MemoryImportance:
-        """确定消息重要性"""
+    def _analyze_text_uncached(
+        self,
+        message: str
+    ) -> Tuple[MemoryImportance, Tuple[MemoryType, ...], Tuple[str, ...], Tuple[str, ...]]:
+        """
+        分析单条消息（通过 self._analyze_text 调用，结果按消息文本缓存）
+        
+        Args:
+            message: 消息内容
+            
+        Returns:
+            Tuple: (重要性, 记忆类型, 关键词, 情感)
+        """
+        # 只转换一次小写，供各项分析共用
         message_lower = message.lower()
         
-        # 检查关键词
-        for importance, keywords in self.importance_keywords.items():
-            for keyword in keywords:
-                if keyword in message_lower:
-                    return importance
+        # 一次扫描找出消息中出现的全部关键词
+        matched = self._match_keywords(message_lower)
+        
+        # 检测重要性
+        importance = self._determine_importance(message, message_lower, matched)
+        
+        # 检测情感
+        emotions = self._detect_emotions(matched)
+        
+        # 检测记忆类型
+        memory_types = self._classify_memory_types(matched, emotions)
+        
+        # 提取关键词
+        keywords = self._extract_keywords(message_lower)
+        
+        return importance, tuple(memory_types), tuple(keywords), tuple(emotions)
+    
+    def _match_keywords(self, message_lower: str) -> Set[str]:
+        """一次扫描找出小写消息中出现的全部关键词（重要性、情感、记忆类型指示词）"""
+        return match_keywords(self._keyword_pattern, self._implied_keywords, message_lower)
+    
+    def _determine_importance(self, message: str, message_lower: str, matched: Set[str]) -> MemoryImportance:
+        """确定消息重要性"""
+        # 检查关键词（按重要性从高到低）
+        for importance, keywords in self._importance_keyword_sets:
+            if not keywords.isdisjoint(matched):
+                return importance
         
         # 检查特殊标记
         if any(marker in message_lower for marker in ["!", "！", "?", "？"]):
@@ -208,29 +341,24 @@ class MemoryManager:
         
         return MemoryImportance.LOW
     
-    def _classify_memory_types(self, message: str) -> List[MemoryType]:
+    def _classify_memory_types(self, matched: Set[str], emotions: List[str]) -> List[MemoryType]:
         """分类记忆类型"""
         types = []
-        message_lower = message.lower()
         
         # 情感记忆
-        if any(emotion_words for emotion_words in self.emotion_keywords.values() 
-               if any(word in message_lower for word in emotion_words)):
+        if emotions:
             types.append(MemoryType.EMOTIONAL)
         
         # 偏好记忆
-        preference_indicators = ["喜欢", "不喜欢", "爱好", "兴趣", "最喜欢", "讨厌"]
-        if any(indicator in message_lower for indicator in preference_indicators):
+        if not PREFERENCE_INDICATORS.isdisjoint(matched):
             types.append(MemoryType.PREFERENCE)
         
         # 事实性记忆
-        factual_indicators = ["是", "在", "有", "会", "能", "做", "工作", "学习", "家"]
-        if any(indicator in message_lower for indicator in factual_indicators):
+        if not FACTUAL_INDICATORS.isdisjoint(matched):
             types.append(MemoryType.FACTUAL)
         
         # 关系记忆
-        relationship_indicators = ["朋友", "家人", "同事", "恋人", "我们", "一起"]
-        if any(indicator in message_lower for indicator in relationship_indicators):
+        if not RELATIONSHIP_INDICATORS.isdisjoint(matched):
             types.append(MemoryType.RELATIONSHIP)
         
         # 如果没有匹配，默认为事实性记忆
@@ -239,31 +367,22 @@ class MemoryManager:
         
         return types
     
-    def _extract_keywords(self, message: str) -> List[str]:
-        """提取关键词"""
+    def _extract_keywords(self, message_lower: str) -> List[str]:
+        """从小写消息中提取关键词"""
         # 简单的关键词提取（可以用更复杂的NLP方法）
-        keywords = []
-        
-        # 移除标点符号，分割单词
-        words = re.findall(r'\w+', message.lower())
-        
-        # 过滤停用词
-        stop_words = {"的", "了", "在", "是", "我", "你", "他", "她", "它", "这", "那", "有", "和", "与"}
-        keywords = [word for word in words if word not in stop_words and len(word) > 1]
-        
-        # 保留前10个关键词
-        return keywords[:10]
+        # 移除标点符号，分割单词，过滤停用词，保留前 MAX_KEYWORDS 个关键词
+        words = WORD_PATTERN.findall(message_lower)
+        return list(islice(
+            (word for word in words if len(word) > 1 and word not in STOP_WORDS),
+            MAX_KEYWORDS
+        ))
     
-    def _detect_emotions(self, message: str) -> List[str]:
+    def _detect_emotions(self, matched: Set[str]) -> List[str]:
         """检测情感"""
-        detected_emotions = []
-        message_lower = message.lower()
-        
-        for emotion, keywords in self.emotion_keywords.items():
-            if any(keyword in message_lower for keyword in keywords):
-                detected_emotions.append(emotion)
-        
-        return detected_emotions
+        return [
+            emotion for emotion, keywords in self._emotion_keyword_sets
+            if not keywords.isdisjoint(matched)
+        ]
     
     def get_relevant_memories(
         self,
@@ -284,91 +403,107 @@ class MemoryManager:
         Returns:
             List[MemoryItem]: 相关记忆列表
         """
-        session_key = f"{character_id}_{session_id}"
+        session_key = (character_id, session_id)
         if session_key not in self._memories:
             return []
         
         memories = self._memories[session_key]
-        current_keywords = self._extract_keywords(current_message)
-        current_emotions = self._detect_emotions(current_message)
+        stats = self._stats[session_key]
+        # 当前消息的关键词和情感只需构建一次集合，供所有记忆比较
+        # （当前消息通常刚在提取记忆时分析过，可直接命中缓存）
+        _, _, keywords, emotions = self._analyze_text(current_message)
+        current_keywords = set(keywords)
+        current_emotions = set(emotions)
+        now = datetime.now()
         
         # 计算相关性分数
         scored_memories = []
-        for memory in memories:
+        for index, memory in enumerate(memories):
             score = self._calculate_relevance_score(
-                memory, current_keywords, current_emotions
+                memory, current_keywords, current_emotions, now
             )
             if score > 0:
                 # 更新访问记录
                 memory.access_count += 1
-                memory.last_accessed = datetime.now()
+                memory.last_accessed = now
+                stats.total_access += 1
+                stats.record_access(memory, index)
                 scored_memories.append((memory, score))
         
-        # 按分数排序
-        scored_memories.sort(key=lambda x: x[1], reverse=True)
+        # 取分数最高的N个记忆（与稳定排序后截取前N个的结果一致）
+        top_memories = heapq.nlargest(max_memories, scored_memories, key=itemgetter(1))
         
-        # 返回前N个最相关的记忆
-        return [memory for memory, score in scored_memories[:max_memories]]
+        return [memory for memory, score in top_memories]
     
     def _calculate_relevance_score(
         self,
         memory: MemoryItem,
-        current_keywords: List[str],
-        current_emotions: List[str]
+        current_keywords: Set[str],
+        current_emotions: Set[str],
+        now: datetime
     ) -> float:
         """计算记忆相关性分数"""
         score = 0.0
         
         # 关键词匹配分数
-        keyword_matches = len(set(memory.keywords) & set(current_keywords))
+        keyword_matches = len(current_keywords.intersection(memory.keywords))
         score += keyword_matches * 10
         
         # 情感匹配分数
-        emotion_matches = len(set(memory.related_emotions) & set(current_emotions))
+        emotion_matches = len(current_emotions.intersection(memory.related_emotions))
         score += emotion_matches * 15
         
         # 重要性权重
-        importance_weights = {
-            MemoryImportance.CRITICAL: 50,
-            MemoryImportance.HIGH: 30,
-            MemoryImportance.MEDIUM: 20,
-            MemoryImportance.LOW: 10
-        }
-        score += importance_weights.get(memory.importance, 10)
+        score += IMPORTANCE_WEIGHTS.get(memory.importance, 10)
         
         # 访问频率权重（经常访问的记忆更重要）
         score += min(memory.access_count * 5, 25)
         
         # 时间衰减（最近的记忆权重更高）
-        days_ago = (datetime.now() - memory.created_at).days
+        days_ago = (now - memory.created_at).days
         time_weight = max(0, 30 - days_ago)
         score += time_weight
         
         return score
     
-    def _cleanup_expired_memories(self, session_key: str):
+    def _cleanup_expired_memories(self, session_key: SessionKey):
         """清理过期记忆"""
         if session_key not in self._memories:
             return
         
         now = datetime.now()
         valid_memories = []
+        next_expiry = None
         
         for memory in self._memories[session_key]:
-            if memory.expires_at is None or memory.expires_at > now:
+            if memory.expires_at is None:
                 valid_memories.append(memory)
+            elif memory.expires_at > now:
+                valid_memories.append(memory)
+                if next_expiry is None or memory.expires_at < next_expiry:
+                    next_expiry = memory.expires_at
+        
+        # 如果记忆过多，按重要性和访问频率保留最重要的记忆
+        if len(valid_memories) > MAX_MEMORIES_PER_SESSION:
+            valid_memories = heapq.nlargest(
+                MAX_MEMORIES_PER_SESSION,
+                valid_memories,
+                key=lambda m: (IMPORTANCE_RANK[m.importance], m.access_count)
+            )
+            next_expiry = min(
+                (m.expires_at for m in valid_memories if m.expires_at is not None),
+                default=None
+            )
         
         self._memories[session_key] = valid_memories
-        
-        # 如果记忆过多，保留最重要的记忆
-        max_memories_per_session = 100
-        if len(self._memories[session_key]) > max_memories_per_session:
-            # 按重要性和访问频率排序
-            self._memories[session_key].sort(
-                key=lambda m: (m.importance.value, m.access_count), 
-                reverse=True
-            )
-            self._memories[session_key] = self._memories[session_key][:max_memories_per_session]
+        # 记忆被移除或重新排列后重建统计
+        stats = _SessionStats()
+        stats.add(valid_memories, 0)
+        self._stats[session_key] = stats
+        if next_expiry is None:
+            self._next_expiry.pop(session_key, None)
+        else:
+            self._next_expiry[session_key] = next_expiry
     
     def get_memory_summary_for_prompt(
         self,
@@ -407,34 +542,25 @@ class MemoryManager:
         session_id: str
     ) -> Dict[str, Any]:
         """获取记忆统计信息"""
-        session_key = f"{character_id}_{session_id}"
+        session_key = (character_id, session_id)
         if session_key not in self._memories:
             return {"total_memories": 0}
         
         memories = self._memories[session_key]
-        
-        # 按类型统计
-        type_counts = {}
-        for memory in memories:
-            type_name = memory.memory_type.value
-            type_counts[type_name] = type_counts.get(type_name, 0) + 1
-        
-        # 按重要性统计
-        importance_counts = {}
-        for memory in memories:
-            importance_name = memory.importance.value
-            importance_counts[importance_name] = importance_counts.get(importance_name, 0) + 1
+        stats = self._stats[session_key]
         
         return {
             "total_memories": len(memories),
-            "by_type": type_counts,
-            "by_importance": importance_counts,
-            "most_accessed": max(memories, key=lambda m: m.access_count).content if memories else None,
-            "average_access_count": sum(m.access_count for m in memories) / len(memories) if memories else 0
+            "by_type": dict(stats.by_type),
+            "by_importance": dict(stats.by_importance),
+            "most_accessed": memories[stats.most_accessed_index].content if memories else None,
+            "average_access_count": stats.total_access / len(memories) if memories else 0
         }
     
     def clear_session_memories(self, character_id: str, session_id: str):
         """清除会话记忆"""
-        session_key = f"{character_id}_{session_id}"
+        session_key = (character_id, session_id)
         if session_key in self._memories:
-            del self._memories[session_key] 
\ No newline at end of file
+            del self._memories[session_key]
+            del self._stats[session_key]
+        self._next_expiry.pop(session_key, None) 
\ No newline at end of file
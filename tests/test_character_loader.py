@@ -0,0 +1,48 @@
+"""
+测试角色加载服务
+"""
+import json
+import pytest
+
+from app.services.character_loader import CharacterLoader
+
+
+def write_character(directory, character_id: str):
+    """写入测试角色配置文件"""
+    data = {
+        "id": character_id,
+        "name": f"角色{character_id}",
+        "description": "一个用于测试的角色描述文字",
+        "personality": "温柔而且很坚定的性格",
+        "system_prompt": "你是测试角色" * 20,
+        "tags": ["测试"]
+    }
+    (directory / f"{character_id}.json").write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+
+class TestCharacterList:
+    """测试角色列表加载"""
+    
+    @pytest.mark.asyncio
+    async def test_cold_list_loads_every_character(self, tmp_path):
+        """冷缓存下一次加载大量角色文件，所有角色都能加载成功"""
+        character_ids = [f"character_{index:02d}" for index in range(20)]
+        for character_id in character_ids:
+            write_character(tmp_path, character_id)
+        loader = CharacterLoader()
+        loader.characters_dir = tmp_path
+        
+        summaries = await loader.get_character_list()
+        
+        assert sorted(summary.id for summary in summaries) == character_ids
+    
+    @pytest.mark.asyncio
+    async def test_invalid_file_does_not_break_list(self, tmp_path):
+        """无法解析的角色文件被跳过，不影响其他角色"""
+        write_character(tmp_path, "valid")
+        (tmp_path / "broken.json").write_text("{not json", encoding="utf-8")
+        loader = CharacterLoader()
+        loader.characters_dir = tmp_path
+        
+        summaries = await loader.get_character_list()
+        
+        assert [summary.id for summary in summaries] == ["valid"]
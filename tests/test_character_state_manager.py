@@ -0,0 +1,58 @@
+"""
+测试角色状态管理器
+"""
+import pytest
+
+from app.models import Character
+from app.services.character_state_manager import CharacterStateManager
+
+
+def make_character(character_id: str = "rei_ayanami") -> Character:
+    """创建测试角色"""
+    return Character(
+        id=character_id,
+        name="测试角色",
+        description="一个用于测试的角色描述文字",
+        personality="温柔而且很坚定的性格",
+        system_prompt="你是测试角色" * 20
+    )
+
+class TestTopicPreferences:
+    """测试话题偏好"""
+    
+    @pytest.mark.parametrize("message", ["我最近在看EVA", "我最近在看eva"])
+    def test_eva_message_raises_character_topic(self, message):
+        """提到EVA（不区分大小写）会提升角色相关话题的偏好"""
+        manager = CharacterStateManager()
+        
+        state = manager.update_state_after_interaction(make_character(), "session", message, "嗯。")
+        
+        assert state.topic_preferences.get("角色相关", 0.0) > 0
+    
+    def test_unrelated_message_keeps_character_topic(self):
+        """不含角色相关关键词的消息不影响该话题偏好"""
+        manager = CharacterStateManager()
+        
+        state = manager.update_state_after_interaction(make_character(), "session", "你好", "嗯。")
+        
+        assert "角色相关" not in state.topic_preferences
+
+class TestBaseEnergy:
+    """测试基础活力值"""
+    
+    def test_reloaded_config_updates_base_energy(self):
+        """角色配置重新加载后，基础活力值按新配置重新计算"""
+        manager = CharacterStateManager()
+        character = make_character()
+        object.__setattr__(character, "_config_data", {"personality_deep": {"big_five_personality": {"extraversion": 3}}})
+        assert manager._get_base_energy(character) == 30
+        
+        object.__setattr__(character, "_config_data", {"personality_deep": {"big_five_personality": {"extraversion": 8}}})
+        
+        assert manager._get_base_energy(character) == 80
+    
+    def test_character_without_config_uses_default(self):
+        """没有配置数据的角色使用默认基础活力值"""
+        manager = CharacterStateManager()
+        
+        assert manager._get_base_energy(make_character()) == 50
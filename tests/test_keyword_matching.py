@@ -0,0 +1,52 @@
+"""
+测试关键词匹配工具
+"""
+from app.services.keyword_matching import compile_keyword_pattern, compile_keywords, match_keywords
+
+
+class TestCompileKeywords:
+    """测试关键词正则编译"""
+    
+    def test_longest_keyword_wins(self):
+        """同一位置优先匹配最长的关键词"""
+        pattern = compile_keywords(("喜欢", "不喜欢"))
+        
+        assert pattern.findall("我不喜欢") == ["不喜欢"]
+    
+    def test_special_characters_are_escaped(self):
+        """正则特殊字符按字面匹配"""
+        pattern = compile_keywords(("...", "?"))
+        
+        assert pattern.search("abc") is None
+        assert pattern.findall("嗯...?") == ["...", "?"]
+    
+    def test_overlapping_matches(self):
+        """允许重叠时，不同位置开始的关键词都能匹配"""
+        pattern = compile_keywords(("生气", "气死了"), overlapping=True)
+        
+        assert pattern.findall("生气死了") == ["生气", "气死了"]
+    
+    def test_pattern_is_cached(self):
+        """相同关键词只编译一次"""
+        assert compile_keywords(("音乐", "电影")) is compile_keywords(("音乐", "电影"))
+
+class TestMatchKeywords:
+    """测试关键词匹配"""
+    
+    def test_finds_all_keywords(self):
+        """一次扫描找出全部出现过的关键词"""
+        pattern, implied = compile_keyword_pattern(["开心", "难过", "音乐"])
+        
+        assert match_keywords(pattern, implied, "听音乐很开心，开心") == {"开心", "音乐"}
+    
+    def test_prefix_keyword_is_implied(self):
+        """较长关键词命中时，作为其前缀的较短关键词也算命中"""
+        pattern, implied = compile_keyword_pattern(["家", "家人", "人"])
+        
+        assert match_keywords(pattern, implied, "家人") == {"家", "家人", "人"}
+    
+    def test_no_match(self):
+        """没有关键词时返回空集合"""
+        pattern, implied = compile_keyword_pattern(["开心"])
+        
+        assert match_keywords(pattern, implied, "今天天气不错") == set()
@@ -0,0 +1,206 @@
+"""
+测试LLM连接器
+"""
+import asyncio
+import time
+from typing import Optional
+
+import httpx
+import pytest
+
+from app.core.exceptions import LLMAPIError, LLMTimeoutError
+from app.services import llm_connector
+from app.services.llm_connector import AbstractLLMProvider, LLMConnector
+
+MESSAGES = [{"role": "user", "content": "你好"}]
+
+
+class FakeProvider(AbstractLLMProvider):
+    """按设定延迟返回结果的测试提供商，errors 中的异常按顺序在各次调用中抛出"""
+    
+    def __init__(self, name: str, delay: float = 0.0, errors=()):
+        super().__init__(name)
+        self.delay = delay
+        self.errors = list(errors)
+        self.calls = 0
+        self.started_at: Optional[float] = None
+        self.cancelled = False
+    
+    async def generate_response(self, messages, temperature=0.8, max_tokens=None, **kwargs):
+        self.calls += 1
+        self.started_at = time.monotonic()
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+        if self.errors:
+            raise self.errors.pop(0)
+        return {"content": "ok", "provider": self.provider_name}
+    
+    async def generate_stream_response(self, messages, temperature=0.8, max_tokens=None, **kwargs):
+        yield self.provider_name
+
+
+def make_connector(*providers: FakeProvider) -> LLMConnector:
+    """创建只包含测试提供商的连接器（第一个为默认提供商）"""
+    connector = LLMConnector.__new__(LLMConnector)
+    connector.providers = {provider.provider_name: provider for provider in providers}
+    connector._factories = {provider.provider_name: (lambda p=provider: p) for provider in providers}
+    connector.default_provider = providers[0].provider_name
+    return connector
+
+class TestHedgedRequests:
+    """测试对冲请求"""
+    
+    HEDGE_DELAY = 0.05
+    
+    @pytest.fixture(autouse=True)
+    def enable_hedging(self, monkeypatch):
+        monkeypatch.setattr(llm_connector.settings, "enable_hedged_requests", True)
+        monkeypatch.setattr(llm_connector.settings, "hedge_delay_seconds", self.HEDGE_DELAY)
+    
+    @pytest.mark.asyncio
+    async def test_fast_primary_does_not_start_backup(self):
+        """主提供商在对冲延迟内返回时不请求备用提供商"""
+        primary, backup = FakeProvider("primary"), FakeProvider("backup")
+        
+        result = await make_connector(primary, backup).generate_response(MESSAGES)
+        
+        assert result["provider"] == "primary"
+        assert backup.calls == 0
+    
+    @pytest.mark.asyncio
+    async def test_slow_primary_starts_backup_after_delay(self):
+        """主提供商响应慢时，等待对冲延迟后请求备用提供商，并取消主请求"""
+        primary, backup = FakeProvider("primary", delay=5.0), FakeProvider("backup")
+        
+        start = time.monotonic()
+        result = await make_connector(primary, backup).generate_response(MESSAGES)
+        await asyncio.sleep(0)
+        
+        assert result["provider"] == "backup"
+        assert backup.started_at - start >= self.HEDGE_DELAY * 0.9
+        assert primary.cancelled
+    
+    @pytest.mark.asyncio
+    async def test_failed_primary_starts_backup_immediately(self, monkeypatch):
+        """主提供商快速失败时立即请求备用提供商，不等待对冲延迟"""
+        monkeypatch.setattr(llm_connector.settings, "hedge_delay_seconds", 5.0)
+        primary = FakeProvider("primary", errors=[LLMAPIError("primary", "bad request", status_code=400)])
+        backup = FakeProvider("backup")
+        
+        start = time.monotonic()
+        result = await make_connector(primary, backup).generate_response(MESSAGES)
+        
+        assert result["provider"] == "backup"
+        assert time.monotonic() - start < 1.0
+    
+    @pytest.mark.asyncio
+    async def test_losing_backup_is_cancelled(self):
+        """主提供商先返回时取消仍在进行的备用请求"""
+        primary = FakeProvider("primary", delay=self.HEDGE_DELAY * 3)
+        backup = FakeProvider("backup", delay=5.0)
+        
+        result = await make_connector(primary, backup).generate_response(MESSAGES)
+        await asyncio.sleep(0)
+        
+        assert result["provider"] == "primary"
+        assert backup.calls == 1
+        assert backup.cancelled
+    
+    @pytest.mark.asyncio
+    async def test_all_failed_reraises_primary_error(self):
+        """所有提供商都失败时抛出主提供商的异常"""
+        primary_error = LLMAPIError("primary", "bad request", status_code=400)
+        primary = FakeProvider("primary", delay=self.HEDGE_DELAY * 3, errors=[primary_error])
+        backup = FakeProvider("backup", errors=[LLMAPIError("backup", "bad request", status_code=400)])
+        
+        with pytest.raises(LLMAPIError) as exc_info:
+            await make_connector(primary, backup).generate_response(MESSAGES)
+        
+        assert exc_info.value is primary_error
+        assert backup.calls == 1
+
+class StatusError(Exception):
+    """携带HTTP状态码的SDK风格异常"""
+    
+    def __init__(self, status_code: int):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+class TestRetryFiltering:
+    """测试重试过滤"""
+    
+    @pytest.fixture(autouse=True)
+    def no_backoff(self, monkeypatch):
+        monkeypatch.setattr(llm_connector, "RETRY_BASE_DELAY", 0)
+        monkeypatch.setattr(llm_connector, "RETRY_MAX_JITTER", 0)
+    
+    @staticmethod
+    def make_provider(errors, max_retries: int = 2) -> FakeProvider:
+        provider = FakeProvider("fake", errors=errors)
+        provider.max_retries = max_retries
+        return provider
+    
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("status_code", [400, 401])
+    async def test_client_errors_are_not_retried(self, status_code):
+        """参数错误、认证失败等客户端错误不重试，原样抛出"""
+        error = LLMAPIError("fake", "client error", status_code=status_code)
+        provider = self.make_provider([error])
+        
+        with pytest.raises(LLMAPIError) as exc_info:
+            await provider._retry_request(provider.generate_response, MESSAGES)
+        
+        assert exc_info.value is error
+        assert provider.calls == 1
+    
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("error", [
+        LLMAPIError("fake", "rate limited", status_code=429),
+        LLMAPIError("fake", "unavailable", status_code=503),
+        StatusError(502),
+        httpx.ConnectError("connection refused"),
+    ])
+    async def test_transient_errors_are_retried(self, error):
+        """限流、服务端错误和网络错误会重试"""
+        provider = self.make_provider([error])
+        
+        result = await provider._retry_request(provider.generate_response, MESSAGES)
+        
+        assert result["content"] == "ok"
+        assert provider.calls == 2
+    
+    @pytest.mark.asyncio
+    async def test_wrapped_transient_error_is_retried(self):
+        """业务异常的原始异常为网络错误时同样会重试"""
+        error = LLMAPIError("fake", "connection refused")
+        error.__cause__ = httpx.ConnectError("connection refused")
+        provider = self.make_provider([error])
+        
+        await provider._retry_request(provider.generate_response, MESSAGES)
+        
+        assert provider.calls == 2
+    
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("status_code", [429, 503])
+    async def test_exhausted_retries_keep_status_code(self, status_code):
+        """重试耗尽后抛出的业务异常保留原始状态码"""
+        provider = self.make_provider([LLMAPIError("fake", "error", status_code=status_code)] * 3)
+        
+        with pytest.raises(LLMAPIError) as exc_info:
+            await provider._retry_request(provider.generate_response, MESSAGES)
+        
+        assert exc_info.value.details["status_code"] == status_code
+        assert provider.calls == 3
+    
+    @pytest.mark.asyncio
+    async def test_exhausted_timeouts_stay_timeouts(self):
+        """超时会重试，重试耗尽后仍抛出超时异常"""
+        provider = self.make_provider([LLMTimeoutError("fake", 30)] * 3)
+        
+        with pytest.raises(LLMTimeoutError):
+            await provider._retry_request(provider.generate_response, MESSAGES)
+        
+        assert provider.calls == 3
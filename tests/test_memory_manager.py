@@ -0,0 +1,25 @@
+"""
+测试会话记忆管理器
+"""
+from app.services.memory_manager import MAX_MEMORIES_PER_SESSION, MemoryImportance, MemoryManager
+
+
+class TestMemoryCleanup:
+    """测试记忆清理"""
+    
+    def test_trim_keeps_most_important_memories(self):
+        """记忆超过上限时按重要性保留，关键和高重要性记忆不会被普通记忆挤掉"""
+        manager = MemoryManager()
+        manager.extract_memories_from_conversation("rei_ayanami", "session", "我爱你", "")
+        manager.extract_memories_from_conversation("rei_ayanami", "session", "我害怕打雷", "")
+        
+        for _ in range(MAX_MEMORIES_PER_SESSION):
+            manager.extract_memories_from_conversation("rei_ayanami", "session", "电影", "")
+        
+        memories = manager._memories[("rei_ayanami", "session")]
+        importances = {memory.importance for memory in memories}
+        
+        assert len(memories) == MAX_MEMORIES_PER_SESSION
+        assert MemoryImportance.CRITICAL in importances
+        assert MemoryImportance.HIGH in importances
+        assert MemoryImportance.LOW not in importances